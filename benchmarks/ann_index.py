@@ -0,0 +1,202 @@
+"""Compare recall@k, latency and memory of ANN index settings for the document index.
+
+Every configuration is a FAISS ``index_factory`` string (the value of
+``INDEX_ANN`` for vector_build.py), optionally followed by ``|`` and the
+search parameters to use at query time (``ANN_SEARCH_PARAMS`` in main.py).
+Recall is measured against exact search over the same vectors, through the
+same ``IndexStore.search`` path the app uses.  Each ANN setting is run once
+per ``--rerank`` value (``ANN_RERANK``): with re-ranking the shortlist is
+re-scored against ``vectors.npy``, so its memory footprint includes the
+vectors; with ``--rerank 0`` only the ANN index is needed.
+
+Usage:
+    python benchmarks/ann_index.py --index document_index
+    python benchmarks/ann_index.py --faiss faiss_index
+    python benchmarks/ann_index.py --synthetic 50000 --dim 1536 --json
+    python benchmarks/ann_index.py --synthetic 20000 \\
+        --config "IVF256,SQ8|nprobe=8" --config "HNSW32|efSearch=64"
+    python benchmarks/ann_index.py --synthetic 20000 --rerank 0
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from index_store import (ANN_RERANK, IndexStore, build_ann_index,  # noqa: E402
+                         faiss, index_exists, set_search_params, write_index)
+
+
+class Chunk:
+    """Stand-in for a LangChain ``Document``; the benchmark never reads text."""
+
+    def __init__(self, i):
+        self.page_content = ""
+        self.metadata = {"source": f"synthetic-{i // 20}.txt"}
+
+
+def synthetic_vectors(count, dim, seed=0):
+    """Unit vectors around a few hundred topics, like chunk embeddings."""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(max(count // 50, 1), dim)).astype(np.float32)
+    vectors = topics[rng.integers(len(topics), size=count)]
+    vectors += 0.5 * rng.normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def legacy_vectors(path):
+    index = faiss.read_index(os.path.join(path, "index.faiss"))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def default_configs(count, dim):
+    nlist = max(8, int(4 * math.sqrt(count)))
+    pq = next((m for m in (32, 16, 8) if dim % m == 0), None)
+    configs = ["Flat"]
+    for factory in [f"IVF{nlist},Flat", f"IVF{nlist},SQ8"] + (
+            [f"IVF{nlist},PQ{pq}"] if pq else []):
+        configs += [f"{factory}|nprobe={n}" for n in (1, 8, 32) if n <= nlist]
+    configs += [f"HNSW32|efSearch={ef}" for ef in (16, 64, 256)]
+    return configs
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3) if values else None
+
+
+def run(store, configs, queries, k, reranks):
+    truth = []
+    store.ann = None
+    for query in queries:
+        truth.append(set(store.search(query, k)[0].tolist()))
+    # What exact search and re-ranking keep paged in
+    vector_bytes = int(store.vectors.nbytes + store.norms.nbytes)
+
+    results = []
+    built = {}
+    runs = [(config, rerank) for config in configs
+            for rerank in ([None] if config.startswith("Flat") else reranks)]
+    for config, rerank in runs:
+        factory, _, params = config.partition("|")
+        result = {"config": config, "factory": factory, "params": params,
+                  "rerank": rerank}
+        try:
+            if factory != "Flat":
+                if factory not in built:
+                    start = time.perf_counter()
+                    ann = build_ann_index(store.vectors, factory)
+                    built[factory] = (ann, time.perf_counter() - start)
+                ann, build_seconds = built[factory]
+                set_search_params(ann, params)
+                result["build_seconds"] = round(build_seconds, 3)
+                result["index_bytes"] = int(faiss.serialize_index(ann).nbytes)
+                result["memory_bytes"] = result["index_bytes"] + (
+                    vector_bytes if rerank else 0)
+                store.ann, store.rerank = ann, rerank
+            else:
+                store.ann = None
+                result["build_seconds"] = 0.0
+                result["index_bytes"] = 0
+                result["memory_bytes"] = vector_bytes
+            latencies, found = [], 0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                rows, _ = store.search(query, k)
+                latencies.append(time.perf_counter() - start)
+                found += len(expected.intersection(rows.tolist()))
+            result.update({
+                f"recall@{k}": round(found / (k * len(queries)), 4),
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "qps": round(len(latencies) / sum(latencies), 1),
+                "error": None,
+            })
+        except Exception as e:
+            result["error"] = str(e)
+        results.append(result)
+    store.ann = None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--index", help="compact index directory "
+                        "(default: document_index when it exists)")
+    source.add_argument("--faiss", help="legacy LangChain FAISS index directory")
+    source.add_argument("--synthetic",
+                        type=int,
+                        default=0,
+                        help="generate N synthetic chunk vectors instead")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--config",
+                        action="append",
+                        help="factory[|params] to test (repeatable)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=15)
+    parser.add_argument("--rerank",
+                        type=int,
+                        nargs="+",
+                        default=[ANN_RERANK, 0],
+                        help="ANN candidates per result re-scored exactly; "
+                        "0 uses the ANN distances (default: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="print JSON only")
+    args = parser.parse_args()
+    if faiss is None:
+        sys.exit("faiss is required: pip install faiss-cpu")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.index or "document_index"
+        if args.synthetic or args.faiss or not index_exists(path):
+            vectors = (legacy_vectors(args.faiss) if args.faiss else
+                       synthetic_vectors(args.synthetic or 10000, args.dim))
+            path = os.path.join(tmp, "index")
+            write_index(path, [Chunk(i) for i in range(len(vectors))], vectors)
+        store = IndexStore.load(path)
+
+        rng = np.random.default_rng(1)
+        rows = rng.integers(len(store), size=args.queries)
+        # Queries near, but not on, stored chunks
+        queries = np.asarray(store.vectors[rows], dtype=np.float32)
+        queries += 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+
+        configs = args.config or default_configs(len(store), store.meta["dim"])
+        results = run(store, configs, queries, args.k, args.rerank)
+        summary = {
+            "vectors": len(store),
+            "dim": store.meta["dim"],
+            "vector_bytes": int(store.vectors.nbytes + store.norms.nbytes),
+            "k": args.k,
+            "queries": args.queries,
+            "rerank": args.rerank,
+            "results": results,
+        }
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"{summary['vectors']} vectors × {summary['dim']} dims, "
+          f"{summary['vector_bytes'] / 2**20:.1f} MiB of vectors and norms, "
+          f"k={args.k}")
+    print(f"{'config':<28} {'rerank':>6} {'recall':>7} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'qps':>8} {'index MiB':>10} {'memory MiB':>11} "
+          f"{'build s':>8}")
+    for r in results:
+        rerank = "-" if r["rerank"] is None else r["rerank"]
+        if r["error"]:
+            print(f"{r['config']:<28} {rerank:>6}  ⚠️ {r['error']}")
+            continue
+        print(f"{r['config']:<28} {rerank:>6} {r[f'recall@{args.k}']:>7} "
+              f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['qps']:>8} "
+              f"{r['index_bytes'] / 2**20:>10.2f} "
+              f"{r['memory_bytes'] / 2**20:>11.2f} {r['build_seconds']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+"""Load-test /ask, document links, pathway matching and /download_zip offline.
+
+OpenAI and Azure are replaced by local stand-ins, so runs cost nothing and
+are repeatable:
+
+- ``FakeEmbeddings`` / ``FakeChain``: deterministic embedding and QA
+  backends that sleep for a configurable latency per call.  A text's vector
+  is the normalised sum of one fixed random vector per word, so queries land
+  near the chunks that share their words.
+- ``DirectoryContainer``: a directory-backed stand-in for the Azure
+  ``ContainerClient`` (``list_blobs``, ``get_blob_client`` with
+  ``download_blob().chunks()`` and ``get_blob_properties().etag``).
+- ``generate_corpus``: writes a synthetic document index (vectors, chunk
+  text, metadata and BM25 index), a pathway index and the blobs themselves.
+
+The real ``main`` module is imported against that corpus and each workload
+is driven at the given concurrency.  Tuning variables from the README
+(``QUERY_CACHE_SIZE``, ``ASK_PARALLEL``, ``INDEX_ANN`` …) apply as usual.
+
+Usage:
+    python benchmarks/app_load.py
+    python benchmarks/app_load.py --files 500 --concurrency 16 --requests 400
+    python benchmarks/app_load.py --workload ask --chat-latency-ms 800 --json
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bm25 import tokenize  # noqa: E402
+
+TOPICS = ("cv interview placement internship reflection teamwork portfolio "
+          "networking enterprise sustainability leadership digital "
+          "communication presentation assessment feedback mentoring "
+          "volunteering research entrepreneurship wellbeing negotiation "
+          "resilience linkedin graduate apprenticeship").split()
+FILLER = ("students module learning outcomes skills employers course staff "
+          "activity workshop session guide support career development plan "
+          "evidence practice example week task group industry").split()
+WORKLOADS = ("ask", "links", "pathways", "download")
+
+
+# ── Model stand-ins ──
+@functools.lru_cache(maxsize=None)
+def _word_vector(word, dim):
+    rng = np.random.default_rng(zlib.crc32(word.encode("utf-8")))
+    return rng.standard_normal(dim).astype(np.float32)
+
+
+def text_vector(text, dim):
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in tokenize(text):
+        vector += _word_vector(word, dim)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class FakeEmbeddings:
+    """``embed_documents``/``embed_query`` with a fixed latency per call."""
+
+    def __init__(self, dim, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [text_vector(t, self.dim).tolist() for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class FakeChain:
+    """Stand-in for the stuff QA chain; answers after ``latency`` seconds."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def run(self, input_documents=None, question=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        sources = sorted({d.metadata.get("source", "") for d in input_documents})
+        return f"Answer to '{question}' based on {', '.join(sources)}."
+
+
+# ── Blob store stand-in ──
+class _Properties:
+    def __init__(self, etag, size):
+        self.etag = etag
+        self.size = size
+
+
+class _Download:
+    def __init__(self, path, chunk_size):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        with open(self.path, "rb") as f:
+            while True:
+                data = f.read(self.chunk_size)
+                if not data:
+                    return
+                yield data
+
+    def readinto(self, stream):
+        for data in self.chunks():
+            stream.write(data)
+
+
+class DirectoryBlobClient:
+    def __init__(self, container, name):
+        self.container = container
+        self.path = os.path.join(container.root, name)
+
+    def get_blob_properties(self):
+        time.sleep(self.container.latency)
+        stat = os.stat(self.path)
+        return _Properties(f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+                           stat.st_size)
+
+    def download_blob(self):
+        time.sleep(self.container.latency)
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+        return _Download(self.path, self.container.chunk_size)
+
+
+class DirectoryContainer:
+    """Serves the files in ``root`` as blobs, ``latency`` seconds per request."""
+
+    def __init__(self, root, latency=0.0, chunk_size=4 * 1024 * 1024):
+        self.root = root
+        self.latency = latency
+        self.chunk_size = chunk_size
+
+    def list_blobs(self):
+        return [type("Blob", (), {"name": name})()
+                for name in sorted(os.listdir(self.root))]
+
+    def get_blob_client(self, name):
+        return DirectoryBlobClient(self, name)
+
+
+# ── Synthetic corpus ──
+def generate_corpus(workspace, files=200, chunks_per_file=20, pathways=40,
+                    dim=1536, blob_kb=256, seed=0):
+    """Write a document index, pathway index and blobs under ``workspace``.
+
+    Returns the file names and a list of sample queries.
+    """
+    import vector_build
+    from index_store import write_index
+    from pathway_matcher import PathwayMatcher
+
+    rng = random.Random(seed)
+    blob_dir = os.path.join(workspace, "blobs")
+    os.makedirs(blob_dir, exist_ok=True)
+    docs, names, queries = [], [], []
+    for n in range(files):
+        topics = rng.sample(TOPICS, 3)
+        name = f"{topics[0]}-{n:04d}.{rng.choice(['pdf', 'docx', 'pptx'])}"
+        names.append(name)
+        metadata = {
+            "source": name,
+            "summary": f"A guide to {topics[0]}, {topics[1]} and {topics[2]} "
+                       "for module teams.",
+            "tags": [topics[0]] + (["general"] if n % 25 == 0 else []),
+        }
+        for _ in range(chunks_per_file):
+            words = [rng.choice(topics) if rng.random() < 0.3
+                     else rng.choice(FILLER) for _ in range(80)]
+            docs.append(vector_build.Document(page_content=" ".join(words),
+                                              metadata=dict(metadata)))
+        with open(os.path.join(blob_dir, name), "wb") as f:
+            f.write(rng.randbytes(blob_kb * 1024))
+        queries.append(f"how can i add {topics[0]} and {topics[1]} "
+                       f"to my {rng.choice(FILLER)} module")
+        queries.append(" ".join(topics[:2]))
+
+    vectors = np.stack([text_vector(d.page_content, dim) for d in docs])
+    lexical = vector_build.build_lexical_index(docs)
+    write_index(os.path.join(workspace, "document_index"), docs, vectors,
+                extra_files={vector_build.LEXICAL_INDEX_FILE: lexical.save})
+
+    entries = []
+    for n in range(pathways):
+        topic = TOPICS[n % len(TOPICS)]
+        entries.append({
+            "title": f"{topic.title()} pathway {n}",
+            "description": f"Activities that build {topic} skills.",
+            "url": f"https://pathways.example/{topic}/{n}",
+            "keywords": [topic],
+        })
+    matrix = np.stack([text_vector(f"{e['title']} {e['description']}", dim)
+                       for e in entries])
+    os.makedirs(os.path.join(workspace, "pathways_index"), exist_ok=True)
+    PathwayMatcher(entries, matrix).save(
+        os.path.join(workspace, "pathways_index", "pathways.npz"))
+    return names, queries
+
+
+# ── Driver ──
+def load_app(workspace, args):
+    """Import ``main`` against the synthetic corpus with the stand-ins."""
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["DOCUMENT_INDEX_DIR"] = os.path.join(workspace, "document_index")
+    os.environ["INDEX_RELOAD_INTERVAL"] = "0"
+    os.environ.pop("AZURE_STORAGE_CONNECTION_STRING", None)
+    os.chdir(workspace)  # pathways_index/ and faiss_index/ are relative
+    # Keep stdout for the report; index load messages go to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        import main as server
+
+    server.EMBEDDINGS = FakeEmbeddings(args.dim, args.embed_latency_ms / 1000)
+    server.QA_CHAIN = FakeChain(args.chat_latency_ms / 1000)
+    container = DirectoryContainer(os.path.join(workspace, "blobs"),
+                                   args.blob_latency_ms / 1000)
+    server.blob_container = lambda: container
+    if server.INDEXES.current.documents is None:
+        raise RuntimeError("synthetic document index did not load")
+    return server
+
+
+def reset_caches(server):
+    """Start a workload with cold query and answer caches."""
+    server.QUERY_CACHE.clear()
+    answers = server.ANSWER_CACHE
+    server.ANSWER_CACHE = server.SemanticCache(answers.threshold,
+                                               answers.max_entries, answers.ttl)
+
+
+def process_peak_rss_mb():
+    """Peak RSS over the whole process lifetime, corpus generation included."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def current_rss_mb():
+    """Resident set size right now, or ``None`` where ``/proc`` is missing."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+class RSSSampler:
+    """Samples current RSS on a thread while a workload runs.
+
+    ``ru_maxrss`` only ever grows, so it cannot tell workloads apart; this
+    records the RSS before the workload and the highest value seen during
+    it, and the difference is what that workload added.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.before = self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None:
+            self.peak = max(self.peak or rss, rss)
+
+    def __enter__(self):
+        self.before = current_rss_mb()
+        self.peak = self.before
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    def report(self):
+        if self.before is None:
+            return {"rss_before_mb": None, "rss_peak_mb": None,
+                    "rss_growth_mb": None}
+        return {
+            "rss_before_mb": round(self.before, 1),
+            "rss_peak_mb": round(self.peak, 1),
+            "rss_growth_mb": round(self.peak - self.before, 1),
+        }
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2) if values else None
+
+
+def run_workload(call, items, concurrency):
+    latencies = []
+    errors = []
+
+    def one(item):
+        start = time.perf_counter()
+        try:
+            call(item)
+        except Exception as e:
+            errors.append(str(e))
+            return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with RSSSampler() as rss, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, items))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(items),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        **rss.report(),
+    }
+
+
+def workloads(server, names, queries, args):
+    clients = threading.local()
+
+    def client():
+        if not hasattr(clients, "client"):
+            clients.client = server.app.test_client()
+        return clients.client
+
+    def ask(query):
+        resp = client().post("/ask", json={"message": query})
+        if resp.status_code != 200:
+            raise RuntimeError(f"/ask returned {resp.status_code}")
+        resp.get_json()
+
+    def download(files):
+        resp = client().post("/download_zip",
+                             json={"files": files, "pathways": []})
+        if resp.status_code != 200:
+            raise RuntimeError(f"/download_zip returned {resp.status_code}")
+        resp.get_data()
+        resp.close()
+
+    rng = random.Random(args.seed)
+    sample = rng.sample(queries, min(args.distinct_queries, len(queries)))
+    asked = [rng.choice(sample) for _ in range(args.requests)]
+    selections = [rng.sample(names, min(args.zip_files, len(names)))
+                  for _ in range(args.requests)]
+    return {
+        "ask": (ask, asked),
+        "links": (server.get_links_with_summaries, asked),
+        "pathways": (server.match_pathways, asked),
+        "download": (download, selections),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workload",
+                        action="append",
+                        choices=WORKLOADS,
+                        help="workload to run (repeatable; default: all)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200,
+                        help="requests per workload")
+    parser.add_argument("--distinct-queries", type=int, default=100,
+                        help="distinct questions the requests are drawn from")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--chunks-per-file", type=int, default=20)
+    parser.add_argument("--pathways", type=int, default=40)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--blob-kb", type=int, default=256)
+    parser.add_argument("--zip-files", type=int, default=3,
+                        help="files per /download_zip request")
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--chat-latency-ms", type=float, default=500)
+    parser.add_argument("--blob-latency-ms", type=float, default=20)
+    parser.add_argument("--warm",
+                        action="store_true",
+                        help="keep query/answer caches between workloads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--json", action="store_true", help="print JSON only")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workspace:
+        start = time.perf_counter()
+        names, queries = generate_corpus(workspace, args.files,
+                                         args.chunks_per_file, args.pathways,
+                                         args.dim, args.blob_kb, args.seed)
+        corpus_seconds = time.perf_counter() - start
+        server = load_app(workspace, args)
+        calls = workloads(server, names, queries, args)
+        results = {}
+        for name in args.workload or WORKLOADS:
+            call, items = calls[name]
+            if not args.warm:
+                reset_caches(server)
+            results[name] = run_workload(call, items, args.concurrency)
+        os.chdir(ROOT)
+
+    report = {
+        "config": {k: v for k, v in vars(args).items()
+                   if k not in ("json", "output")},
+        "corpus": {
+            "files": args.files,
+            "chunks": args.files * args.chunks_per_file,
+            "seconds": round(corpus_seconds, 2),
+        },
+        "commit": _git_commit(),
+        "workloads": results,
+        "process_peak_rss_mb": process_peak_rss_mb(),
+        "embedding_calls": server.EMBEDDINGS.calls,
+        "chat_calls": server.QA_CHAIN.calls,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['corpus']['chunks']} chunks in {args.files} files, "
+          f"concurrency {args.concurrency}, {args.requests} requests each")
+    print(f"{'workload':<10} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'errors':>7} {'RSS +MiB':>9}")
+    for name, r in results.items():
+        print(f"{name:<10} {r['throughput_rps']:>8} {r['p50_ms']:>9} "
+              f"{r['p95_ms']:>9} {r['p99_ms']:>9} {r['errors']:>7} "
+              f"{r['rss_growth_mb'] if r['rss_growth_mb'] is not None else '-':>9}"
+              + (f"  ⚠️ {r['first_error']}" if r["first_error"] else ""))
+    print(f"process peak RSS {report['process_peak_rss_mb']} MiB, "
+          f"{report['embedding_calls']} embedding calls, "
+          f"{report['chat_calls']} chat calls")
+
+
+def _git_commit():
+    """Commit the run measured, so reports can be compared across changes."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short=12", "HEAD"],
+                              cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Compare pages/sec of the PDF extractor backends registered in vector_build.
+
+Usage:
+    python benchmarks/pdf_extractors.py docs/*.pdf
+    python benchmarks/pdf_extractors.py --synthetic 200 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vector_build  # noqa: E402
+
+
+def synthetic_pdf(pages):
+    """Build an in-memory PDF with ``pages`` pages of filler text."""
+    doc = vector_build.pymupdf.open()
+    line = "Employability skills embedded in the curriculum. " * 2
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (36, 36, -36, -36),
+                            f"Page {n + 1}\n" + "\n".join([line] * 40),
+                            fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def run(pdfs, repeat):
+    results = []
+    for name, extractor in vector_build.EXTRACTORS[".pdf"]:
+        pages = chars = 0
+        elapsed = 0.0
+        error = None
+        for _ in range(repeat):
+            for _, data in pdfs:
+                start = time.perf_counter()
+                try:
+                    for text in extractor(data):
+                        pages += 1
+                        chars += len(text)
+                except Exception as e:
+                    error = str(e)
+                elapsed += time.perf_counter() - start
+        results.append({
+            "backend": name,
+            "pages": pages,
+            "chars": chars,
+            "seconds": round(elapsed, 4),
+            "pages_per_sec": round(pages / elapsed, 1) if elapsed else None,
+            "error": error,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="*", help="PDF files to extract")
+    parser.add_argument("--synthetic",
+                        type=int,
+                        default=0,
+                        help="also benchmark a generated PDF with N pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print JSON only")
+    args = parser.parse_args()
+
+    pdfs = []
+    for path in args.pdfs:
+        with open(path, "rb") as f:
+            pdfs.append((path, f.read()))
+    if args.synthetic or not pdfs:
+        pdfs.append(("synthetic", synthetic_pdf(args.synthetic or 100)))
+
+    results = run(pdfs, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'backend':<10} {'pages':>7} {'seconds':>9} {'pages/sec':>10}")
+    for r in results:
+        print(f"{r['backend']:<10} {r['pages']:>7} {r['seconds']:>9} "
+              f"{r['pages_per_sec'] or '-':>10}"
+              + (f"  ⚠️ {r['error']}" if r["error"] else ""))
+
+
+if __name__ == "__main__":
+    main()
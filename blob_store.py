@@ -0,0 +1,292 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+
+# Size of each ranged GET when a blob is downloaded.  Bounds the memory held
+# per file while it is streamed and the amount of data in flight per request.
+BLOB_CHUNK_SIZE = 4 * 1024 * 1024
+
+_lock = threading.Lock()
+_containers = {}
+
+
+def _pooled_transport(pool_size):
+    """HTTP transport whose keep-alive pool holds ``pool_size`` connections."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                            pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return RequestsTransport(session=session, session_owner=False)
+
+
+def get_container_client(connection_string, container_name, pool_size=10):
+    """Return the process-wide container client for ``container_name``.
+
+    The service client is created on first use and then shared by every
+    caller, so the connection string is parsed once and TLS connections are
+    reused across requests instead of being set up for each one.
+    """
+    key = (connection_string, container_name)
+    container = _containers.get(key)
+    if container is None:
+        with _lock:
+            container = _containers.get(key)
+            if container is None:
+                service = BlobServiceClient.from_connection_string(
+                    connection_string,
+                    transport=_pooled_transport(pool_size),
+                    max_single_get_size=BLOB_CHUNK_SIZE,
+                    max_chunk_get_size=BLOB_CHUNK_SIZE)
+                container = service.get_container_client(container_name)
+                _containers[key] = container
+    return container
+
+
+class DiskLRU:
+    """Directory of files bounded by total size, evicted least-recently-used.
+
+    Files are written under a temporary name and renamed into place, so
+    several workers can share the directory without ever reading a partial
+    file.  Recency is tracked through each file's mtime.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def open(self, key):
+        """Open the file stored under ``key`` and mark it as recently used."""
+        path = self.path(key)
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return f
+
+    def writer(self):
+        """Return ``(file, temp_path)`` for a new entry; pass it to ``commit``."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        return os.fdopen(fd, "wb"), tmp_path
+
+    def commit(self, tmp_path, key):
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+    def tee(self, key, chunks):
+        """Yield ``chunks`` unchanged while storing them under ``key``.
+
+        The entry is only committed once the iterator has been consumed to the
+        end, so an interrupted download never leaves a truncated file behind.
+        """
+        f, tmp_path = self.writer()
+        try:
+            with f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            self.commit(tmp_path, key)
+        finally:
+            self.discard(tmp_path)
+
+    def discard(self, tmp_path):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".part") or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+
+def _read_chunks(f, chunk_size=BLOB_CHUNK_SIZE):
+    with f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return
+            yield data
+
+
+def _atomic_write_text(path, text):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class _HitCounter:
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class BlobCache(_HitCounter):
+    """Local, content-addressed copies of blobs keyed by blob name + ETag.
+
+    A cached copy is revalidated with a conditional GET (``If-None-Match``);
+    Azure answers 304 while the blob is unchanged, so the bytes are served
+    from disk and only changed blobs are transferred again.  Entries younger
+    than ``revalidate_after`` seconds are served without asking at all.
+    """
+
+    def __init__(self, root, max_bytes, revalidate_after=0):
+        super().__init__()
+        self.files = DiskLRU(os.path.join(root, "blobs"), max_bytes)
+        self.refs = os.path.join(root, "refs")
+        self.revalidate_after = revalidate_after
+        os.makedirs(self.refs, exist_ok=True)
+
+    @staticmethod
+    def _key(name, etag):
+        return hashlib.sha256(f"{name}\0{etag}".encode()).hexdigest()
+
+    def _ref_path(self, name):
+        return os.path.join(self.refs, hashlib.sha256(name.encode()).hexdigest())
+
+    def _read_ref(self, name):
+        """Return ``(etag, age_seconds)`` of the cached copy of ``name``."""
+        path = self._ref_path(name)
+        try:
+            with open(path) as f:
+                etag = f.read()
+            return etag, time.time() - os.path.getmtime(path)
+        except FileNotFoundError:
+            return None, None
+
+    def open(self, container, name):
+        """Start fetching blob ``name`` and return an iterator over its bytes.
+
+        The network round trip (if any) happens here; reading the returned
+        iterator streams from disk or from the open download.
+        """
+        etag, age = self._read_ref(name)
+        local = self.files.open(self._key(name, etag)) if etag else None
+        blob = container.get_blob_client(name)
+
+        if local is not None:
+            if age < self.revalidate_after:
+                self._count(hit=True)
+                return _read_chunks(local)
+            try:
+                downloader = blob.download_blob(
+                    etag=etag, match_condition=MatchConditions.IfModified)
+            except HttpResponseError as e:
+                # The SDK surfaces 304 Not Modified as a plain HttpResponseError
+                if e.status_code != 304:
+                    raise
+                os.utime(self._ref_path(name))
+                self._count(hit=True)
+                return _read_chunks(local)
+            local.close()
+        else:
+            downloader = blob.download_blob()
+
+        self._count(hit=False)
+        return self._store(name, downloader.properties.etag, downloader.chunks())
+
+    def _store(self, name, etag, chunks):
+        """Pass ``chunks`` through while writing them to the cache."""
+        yield from self.files.tee(self._key(name, etag), chunks)
+        _atomic_write_text(self._ref_path(name), etag)
+
+
+class BundleCache(_HitCounter):
+    """Finished ZIP archives keyed by exactly what went into them.
+
+    The key covers the sorted file list, each blob's ETag and a hash of the
+    pathways payload, so a hit can be sent straight from disk and any change
+    to a blob produces a new key.
+    """
+
+    def __init__(self, root, max_bytes):
+        super().__init__()
+        self.files = DiskLRU(root, max_bytes)
+
+    @staticmethod
+    def key(files, etags, pathways):
+        pathways_hash = hashlib.sha256(
+            json.dumps(pathways, sort_keys=True).encode()).hexdigest()
+        payload = json.dumps([sorted(zip(files, etags)), pathways_hash])
+        return hashlib.sha256(payload.encode()).hexdigest() + ".zip"
+
+    def open(self, key):
+        """Return an open file for the bundle stored under ``key``, or ``None``."""
+        f = self.files.open(key)
+        self._count(hit=f is not None)
+        return f
+
+    def store(self, key, chunks):
+        """Yield the archive ``chunks`` while saving them under ``key``."""
+        return self.files.tee(key, chunks)
+
+
+def blob_etags(container, names, max_workers=4):
+    """Fetch the current ETag of each blob in ``names`` (HEAD requests only)."""
+    def etag(name):
+        return container.get_blob_client(name).get_blob_properties().etag
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(etag, names))
+
+
+def open_blob(container, name, cache=None):
+    """Start downloading blob ``name`` and return an iterator over its bytes."""
+    if cache is not None:
+        return cache.open(container, name)
+    return container.get_blob_client(name).download_blob().chunks()
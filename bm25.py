@@ -0,0 +1,142 @@
+import json
+import re
+from collections import Counter
+
+import numpy as np
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do for from how i in is it me my of on or "
+    "the to what with you your".split())
+
+
+def tokenize(text):
+    """Lower-case alphanumeric terms of ``text`` without common stopwords."""
+    return [t for t in re.findall(r"[a-z0-9]+", (text or "").lower())
+            if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of entries, stored as compact postings.
+
+    Postings are kept CSR-style (``indptr`` per term into parallel
+    ``doc_ids``/``tfs`` arrays) so a query only touches the rows of its own
+    terms and scores every entry with a few NumPy operations.  Each entry
+    has a string ``key`` and an optional JSON-serialisable ``payload``.
+    """
+
+    def __init__(self, vocab, indptr, doc_ids, tfs, doc_len, keys,
+                 payloads=None, k1=1.5, b=0.75):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        self.keys = list(keys)
+        self.payloads = payloads
+        self.k1 = k1
+        self.b = b
+        n = len(self.keys)
+        df = np.diff(indptr)
+        self.idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        avg = doc_len.mean() if n else 1.0
+        self._norm = k1 * (1 - b + b * doc_len / (avg or 1.0))
+
+    @classmethod
+    def build(cls, keys, texts, payloads=None, k1=1.5, b=0.75):
+        """Index ``texts`` (strings or token lists), one entry per key."""
+        postings = {}
+        doc_len = []
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text) if isinstance(text, str) else text
+            doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_ids, tfs = [], []
+        for i, term in enumerate(terms):
+            for doc_id, tf in postings[term]:
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+            indptr[i + 1] = len(doc_ids)
+        return cls({t: i for i, t in enumerate(terms)}, indptr,
+                   np.asarray(doc_ids, dtype=np.int32),
+                   np.asarray(tfs, dtype=np.float32),
+                   np.asarray(doc_len, dtype=np.float32), keys, payloads,
+                   k1, b)
+
+    def save(self, path):
+        terms = sorted(self.vocab, key=self.vocab.get)
+        with open(path, "wb") as f:
+            np.savez(f,
+                     terms=np.asarray(terms, dtype=str),
+                     indptr=self.indptr,
+                     doc_ids=self.doc_ids,
+                     tfs=self.tfs,
+                     doc_len=self.doc_len,
+                     keys=np.asarray(self.keys, dtype=str),
+                     payloads=np.asarray(
+                         [json.dumps(p) for p in self.payloads or []],
+                         dtype=str),
+                     params=np.asarray([self.k1, self.b]))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            payloads = [json.loads(p) for p in data["payloads"]] or None
+            k1, b = data["params"].tolist()
+            return cls({t: i for i, t in enumerate(data["terms"].tolist())},
+                       data["indptr"], data["doc_ids"], data["tfs"],
+                       data["doc_len"], data["keys"].tolist(), payloads, k1, b)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def known_terms(self, query):
+        """Query terms that occur somewhere in the index."""
+        return [t for t in tokenize(query) if t in self.vocab]
+
+    def scores(self, query):
+        """BM25 score of every entry for ``query``."""
+        scores = np.zeros(len(self.keys), dtype=np.float32)
+        for term in set(self.known_terms(query)):
+            t = self.vocab[term]
+            start, end = self.indptr[t], self.indptr[t + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            scores[docs] += self.idf[t] * tf * (self.k1 + 1) / (
+                tf + self._norm[docs])
+        return scores
+
+    def search(self, query, k=10):
+        """Return up to ``k`` ``(entry, score)`` pairs with a positive score,
+        best first."""
+        scores = self.scores(query)
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(int(i), float(scores[i])) for i in hits]
+
+
+def reciprocal_rank_fusion(rankings, k=60, weights=None):
+    """Fuse ranked lists of keys; returns keys ordered by their RRF score.
+
+    Each list contributes ``weight / (k + rank)`` to the keys in it; a key
+    repeated within one list counts at its best rank.
+    """
+    rankings = [list(dict.fromkeys(ranking)) for ranking in rankings]
+    keys = list(dict.fromkeys(key for ranking in rankings for key in ranking))
+    if not keys:
+        return []
+    position = {key: i for i, key in enumerate(keys)}
+    fused = np.zeros(len(keys))
+    for ranking, weight in zip(rankings, weights or [1.0] * len(rankings)):
+        if not ranking:
+            continue
+        rows = np.fromiter((position[key] for key in ranking), dtype=np.int64,
+                           count=len(ranking))
+        fused[rows] += weight / (k + 1 + np.arange(len(ranking)))
+    order = np.argsort(-fused, kind="stable")
+    return [keys[i] for i in order]
@@ -1,7 +1,7 @@
 import json
+import os
 
 try:
-    from langchain_community.vectorstores import FAISS
     from langchain_openai import OpenAIEmbeddings
 except ModuleNotFoundError as e:
     missing = str(e).split("'")[1]
@@ -11,23 +11,29 @@ except ModuleNotFoundError as e:
     )
     raise SystemExit(1)
 
+from pathway_matcher import PathwayMatcher
+
 # Load pathway data
 with open("pathways.json", "r", encoding="utf-8") as f:
     data = json.load(f)
 
 texts = []
-metadatas = []
+entries = []
 for entry in data:
     text = f"{entry.get('title', '')}\n{entry.get('description', '')}"
     texts.append(text)
-    metadatas.append({
+    entries.append({
         "title": entry.get("title", ""),
         "description": entry.get("description", ""),
-        "url": entry.get("url", "")
+        "url": entry.get("url", ""),
+        "keywords": entry.get("keywords", []),
     })
 
-# Build and save FAISS index
+# Embed every pathway and save the matrix with its keyword metadata
 embeddings = OpenAIEmbeddings()
-index = FAISS.from_texts(texts, embeddings, metadatas=metadatas)
-index.save_local("pathways_index")
+matcher = PathwayMatcher(entries, embeddings.embed_documents(texts))
+os.makedirs("pathways_index", exist_ok=True)
+tmp_path = "pathways_index/pathways.npz.tmp"
+matcher.save(tmp_path)
+os.replace(tmp_path, "pathways_index/pathways.npz")
 print(f"✅ Built pathways_index with {len(texts)} entries")
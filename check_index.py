@@ -1,12 +1,23 @@
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
+import os
 
-# Load the FAISS index
-vectorstore = FAISS.load_local("faiss_index", OpenAIEmbeddings(), allow_dangerous_deserialization=True)
+from index_store import IndexStore, index_exists
 
-# Inspect the documents in the index
-docs = vectorstore.docstore._dict
+INDEX_DIR = os.getenv("DOCUMENT_INDEX_DIR", "document_index")
+
+# Load the compact index, or the older pickle-based FAISS index
+if index_exists(INDEX_DIR):
+    store = IndexStore.load(INDEX_DIR)
+    metadatas = [store.metadata(i) for i in range(len(store))]
+    print(f"\n📦 {len(store)} chunks, {store.meta['dim']} dims "
+          f"({store.meta['dtype']}), {len(store.documents)} documents")
+else:
+    from langchain_community.vectorstores import FAISS
+    from langchain_openai import OpenAIEmbeddings
 
-print("\n📂 Documents in FAISS Index:\n")
-for i, (doc_id, doc) in enumerate(docs.items()):
-    print(f"{i + 1}. {doc.metadata.get('source', 'Unknown source')}")
+    vectorstore = FAISS.load_local("faiss_index", OpenAIEmbeddings(), allow_dangerous_deserialization=True)
+    metadatas = [doc.metadata for doc in vectorstore.docstore._dict.values()]
+
+# Inspect the documents in the index
+print("\n📂 Documents in Index:\n")
+for i, metadata in enumerate(metadatas):
+    print(f"{i + 1}. {metadata.get('source', 'Unknown source')}")
@@ -0,0 +1,142 @@
+import argparse
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """Chunk embeddings on disk, keyed by (embedding model, SHA-256 of text)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, "
+                "vector BLOB NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (model, text_hash))")
+
+    def get_many(self, model, hashes):
+        """Return ``{hash: vector}`` for the hashes already stored."""
+        found = {}
+        now = time.time()
+        unique = list(dict.fromkeys(hashes))
+        with self._lock, self._conn:
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({marks})",
+                    [model, *batch]).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+                self._conn.execute(
+                    f"UPDATE embeddings SET last_used = ? "
+                    f"WHERE model = ? AND text_hash IN ({marks})",
+                    [now, model, *batch])
+        return found
+
+    def put_many(self, model, items):
+        """Store ``(hash, vector)`` pairs for ``model``."""
+        now = time.time()
+        rows = [(model, h, np.asarray(vec, dtype=np.float32).tobytes(), now)
+                for h, vec in items]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def compact(self, older_than_days=30):
+        """Drop vectors unused for ``older_than_days`` and reclaim the space."""
+        cutoff = time.time() - older_than_days * 86400
+        with self._lock:
+            with self._conn:
+                removed = self._conn.execute(
+                    "DELETE FROM embeddings WHERE last_used < ?",
+                    (cutoff, )).rowcount
+            self._conn.execute("VACUUM")
+        return removed
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap an embeddings client so only chunks never seen before are sent.
+
+    Chunks are looked up in ``store`` by the hash of their text; misses are
+    embedded in one call to the wrapped client and written back.
+    """
+
+    def __init__(self, embeddings, store, model=None):
+        self.embeddings = embeddings
+        self.store = store
+        self.model = model or getattr(embeddings, "model", None) or "default"
+        self.hits = 0
+        self.embedded = 0
+        self.api_calls = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(t) for t in texts]
+        found = self.store.get_many(self.model, hashes)
+
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in found:
+                missing.setdefault(h, text)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new = dict(zip(missing, vectors))
+            self.store.put_many(self.model, new.items())
+            found.update(new)
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.embedded += len(missing)
+            self.api_calls += 1 if missing else 0
+        return [found[h] for h in hashes]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.embedded
+            return {
+                "cached": self.hits,
+                "embedded": self.embedded,
+                "api_calls": self.api_calls,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Inspect or compact the chunk embedding cache.")
+    parser.add_argument("command", choices=["stats", "compact"])
+    parser.add_argument("--db", default="embedding_cache.sqlite")
+    parser.add_argument("--older-than",
+                        type=float,
+                        default=30,
+                        help="days since last use before a vector is dropped")
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.db)
+    if args.command == "compact":
+        removed = store.compact(args.older_than)
+        print(f"✅ Removed {removed} unused vectors; {store.count()} remain")
+    else:
+        print(f"📦 {store.count()} cached vectors in {args.db}")
@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class EmbeddingDispatcher:
+    """Coalesce concurrent query embeddings into batched API calls.
+
+    ``embed(text)`` queues the text and blocks until its vector is ready.  A
+    background thread takes the first waiting text and, if another batch is
+    still in flight, keeps collecting for up to ``window`` seconds or
+    ``max_batch`` texts before sending them all in one ``embed_many`` call;
+    when nothing is in flight the text is sent straight away, so an idle
+    server adds no latency.  At most ``max_in_flight`` calls run at once;
+    texts arriving while that limit is reached simply join the next batch.
+    Identical texts already queued or in flight share one future
+    (single-flight), so a burst of the same query costs one input.
+    """
+
+    def __init__(self, embed_many, window=0.005, max_batch=64,
+                 max_in_flight=4):
+        self.embed_many = embed_many
+        self.window = window
+        self.max_batch = max_batch
+        self.requests = 0
+        self.deduplicated = 0
+        self.batches = 0
+        self.embedded = 0
+        self._pending = {}
+        self._queue = queue.Queue()
+        self._in_flight = 0
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._senders = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run,
+                                        name="embedding-dispatcher",
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """Return a ``Future`` for the embedding of ``text``."""
+        with self._lock:
+            self.requests += 1
+            future = self._pending.get(text)
+            if future is not None:
+                self.deduplicated += 1
+                return future
+            future = self._pending[text] = Future()
+        self._queue.put(text)
+        return future
+
+    def embed(self, text, timeout=None):
+        return self.submit(text).result(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            with self._lock:
+                busy = self._in_flight > 0
+            # Only wait for company when other requests are already running
+            deadline = time.monotonic() + (self.window if busy else 0)
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining)
+                                 if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._slots.acquire()
+            # Texts queued while waiting for a slot ride along in this batch
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._lock:
+                self._in_flight += 1
+            self._senders.submit(self._send, batch)
+
+    def _send(self, texts):
+        try:
+            vectors = self.embed_many(texts)
+            error = None
+        except Exception as e:
+            vectors, error = None, e
+        with self._lock:
+            self._in_flight -= 1
+            self.batches += 1
+            self.embedded += len(texts)
+            futures = [self._pending.pop(text) for text in texts]
+        self._slots.release()
+        for i, future in enumerate(futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(vectors[i])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "deduplicated": self.deduplicated,
+                "batches": self.batches,
+                "mean_batch_size":
+                self.embedded / self.batches if self.batches else 0.0,
+            }
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import threading
+import time
+
+
+def index_version(*paths):
+    """Fingerprint the index files on disk.
+
+    Cached retrieval results are keyed by this value, so they stop matching as
+    soon as a rebuilt index is loaded.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        for root, _, files in sorted(os.walk(path)):
+            for fname in sorted(files):
+                try:
+                    stat = os.stat(os.path.join(root, fname))
+                except FileNotFoundError:  # removed mid-walk by a rebuild
+                    continue
+                digest.update(
+                    f"{root}/{fname}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+
+class IndexManager:
+    """Holds the active index snapshot and swaps in rebuilt ones.
+
+    ``loader(version, previous)`` loads the files under ``paths`` into a new
+    snapshot object with a ``version`` attribute.  ``reload`` runs it off the
+    request path and replaces ``current`` with a single assignment, so
+    requests that already took the old snapshot finish on it and new ones
+    see the new version.  ``watch`` polls the fingerprint of ``paths`` and
+    reloads once it has stopped changing between two polls.
+    """
+
+    def __init__(self, loader, paths):
+        self.loader = loader
+        self.paths = paths
+        self.current = None
+        self.loaded_at = None
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def fingerprint(self):
+        return index_version(*self.paths)
+
+    def install(self, snapshot):
+        self.current = snapshot
+        self.loaded_at = time.time()
+        self.reloads += 1
+
+    def reload(self, force=False):
+        """Load the indexes on disk and make them current.
+
+        Returns ``True`` when a new snapshot was installed, ``False`` when the
+        files have not changed since the current one was loaded.
+        """
+        with self._lock:
+            version = self.fingerprint()
+            current = self.current
+            if not force and current is not None and current.version == version:
+                return False
+            self.install(self.loader(version, current))
+            return True
+
+    def watch(self, interval):
+        """Start a daemon thread that reloads when the index files change."""
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def poll():
+            last = self.fingerprint()
+            while not self._stop.wait(interval):
+                seen = self.fingerprint()
+                # Reload only once a rebuild has finished writing its files
+                if seen == last and seen != self.current.version:
+                    try:
+                        if self.reload():
+                            print(f"✅ Index reloaded: version {seen}")
+                    except Exception as e:
+                        print(f"⚠️ Index reload failed: {e}")
+                last = seen
+
+        self._watcher = threading.Thread(target=poll,
+                                         name="index-watcher",
+                                         daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "version": self.current.version if self.current else None,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+        }
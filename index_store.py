@@ -0,0 +1,290 @@
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+from langchain.schema import Document
+
+try:
+    import faiss
+except ImportError:  # only needed for approximate search
+    faiss = None
+
+FORMAT_VERSION = 1
+# Rows scored per matrix product, so a float16 store is widened block by block
+# instead of being copied to float32 in full.
+SEARCH_BLOCK = 65536
+# Optional approximate-nearest-neighbour index written next to the vectors
+ANN_INDEX_FILE = "ann.faiss"
+# Candidates fetched from the ANN index per requested result; they are
+# re-scored exactly against the stored vectors before the top k are kept.
+# 0 returns the ANN index's own distances and never reads the vectors.
+ANN_RERANK = 4
+
+
+def index_exists(path):
+    return os.path.exists(os.path.join(path, "meta.json"))
+
+
+def _metadata_key(metadata):
+    return json.dumps(metadata, sort_keys=True, default=str)
+
+
+def write_index(path, docs, vectors, dtype="float32", extra_files=None,
+                meta=None):
+    """Write ``docs`` and their ``vectors`` to ``path`` in the compact format.
+
+    The directory holds:
+
+    - ``vectors.npy``: one row per chunk, ``float32`` or ``float16``
+    - ``norms.npy``: squared norm of each row, for L2 distances
+    - ``chunks.bin`` / ``offsets.npy``: UTF-8 chunk text and its byte offsets
+    - ``documents.json`` / ``chunk_docs.npy``: each distinct metadata dict
+      once, and the row of it that every chunk belongs to
+    - ``meta.json``: format version, row count, dimension and dtype
+
+    ``extra_files`` maps further file names to functions that write them
+    (given the full path), so derived indexes are swapped in together with
+    the vectors they were built from, and ``meta`` adds fields to
+    ``meta.json`` (such as ``ann_rerank``).
+
+    Each build is written to its own ``<path>.v<timestamp>`` directory and
+    ``path`` is a symlink to the current one, replaced in a single
+    ``os.replace`` so that ``path`` always names a complete index.  Readers
+    that still have the old files mapped keep reading them until they
+    reload; the version before the new one is kept for readers that are
+    mid-load, and older ones are removed.
+    """
+    vectors = np.asarray(vectors, dtype=dtype)
+    if len(docs) != len(vectors):
+        raise ValueError(f"{len(docs)} documents but {len(vectors)} vectors")
+    if vectors.ndim != 2:
+        vectors = vectors.reshape(len(docs), -1) if len(docs) else \
+            vectors.reshape(0, 0)
+
+    documents, doc_rows, chunk_docs = [], {}, []
+    offsets = [0]
+    tmp_path = f"{path}.v{time.time_ns()}"
+    os.makedirs(tmp_path)
+
+    with open(os.path.join(tmp_path, "chunks.bin"), "wb") as f:
+        for doc in docs:
+            key = _metadata_key(doc.metadata)
+            if key not in doc_rows:
+                doc_rows[key] = len(documents)
+                documents.append(doc.metadata)
+            chunk_docs.append(doc_rows[key])
+            data = doc.page_content.encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+
+    wide = vectors.astype(np.float32)
+    np.save(os.path.join(tmp_path, "vectors.npy"), vectors)
+    np.save(os.path.join(tmp_path, "norms.npy"), (wide * wide).sum(axis=1))
+    np.save(os.path.join(tmp_path, "offsets.npy"),
+            np.asarray(offsets, dtype=np.int64))
+    np.save(os.path.join(tmp_path, "chunk_docs.npy"),
+            np.asarray(chunk_docs, dtype=np.int32))
+    with open(os.path.join(tmp_path, "documents.json"), "w") as f:
+        json.dump(documents, f, default=str)
+    for name, write in (extra_files or {}).items():
+        write(os.path.join(tmp_path, name))
+    # meta.json last: a directory without it is never treated as an index
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({
+            "format": FORMAT_VERSION,
+            "count": len(docs),
+            "dim": int(vectors.shape[1]),
+            "dtype": str(vectors.dtype),
+            **(meta or {}),
+        }, f)
+
+    _switch_version(path, tmp_path)
+
+
+def _switch_version(path, version_path):
+    """Point the ``path`` symlink at ``version_path`` and prune old versions."""
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    link_path = f"{path}.link"
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.symlink(os.path.basename(version_path), link_path)
+    if os.path.isdir(path) and not os.path.islink(path):
+        # A plain directory from an older build is moved aside once
+        shutil.rmtree(f"{path}.old", ignore_errors=True)
+        os.replace(path, f"{path}.old")
+    os.replace(link_path, path)
+
+    parent, name = os.path.split(os.path.abspath(path))
+    keep = {os.path.realpath(version_path), previous}
+    stale = re.compile(re.escape(name) + r"\.(v\d+|tmp|old)")
+    for entry in os.listdir(parent):
+        entry_path = os.path.join(parent, entry)
+        if stale.fullmatch(entry) and os.path.realpath(entry_path) not in keep:
+            shutil.rmtree(entry_path, ignore_errors=True)
+
+
+def build_ann_index(vectors, factory):
+    """Train and fill a FAISS index described by ``factory``.
+
+    ``factory`` is a FAISS ``index_factory`` string such as ``"HNSW32"``,
+    ``"IVF256,Flat"``, ``"IVF256,SQ8"`` or ``"IVF256,PQ32"``; the index uses
+    L2 distance like the exact search, and its ids are the store's rows.
+    """
+    if faiss is None:
+        raise RuntimeError("faiss is required for approximate search")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    for start in range(0, len(vectors), SEARCH_BLOCK):
+        index.add(vectors[start:start + SEARCH_BLOCK])
+    return index
+
+
+def write_ann_index(index, path):
+    faiss.write_index(index, path)
+
+
+def set_search_params(index, params):
+    """Apply FAISS search parameters such as ``"nprobe=16"`` or
+    ``"efSearch=64"`` (comma separated) to ``index``."""
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, params)
+
+
+def faiss_rows(db):
+    """Return ``(docs, vectors)`` from a LangChain ``FAISS`` store, in index
+    order, so an existing pickle index can be converted without re-embedding."""
+    ntotal = db.index.ntotal
+    vectors = db.index.reconstruct_n(0, ntotal) if ntotal else np.zeros((0, 0))
+    docs = [db.docstore.search(db.index_to_docstore_id[i])
+            for i in range(ntotal)]
+    return docs, vectors
+
+
+class IndexStore:
+    """Read-only, memory-mapped view of an index written by ``write_index``.
+
+    Vectors and chunk text stay on disk and are paged in by the OS as they
+    are touched, so loading is fast and several worker processes share the
+    same pages.  Searches use exact squared L2 distance, matching the flat
+    FAISS index they replace, and return LangChain ``Document`` objects.
+
+    When the build also wrote an ``ann.faiss`` index (see
+    ``build_ann_index``) and FAISS is installed, it is used to shortlist
+    ``rerank`` times as many rows as requested; those are re-scored exactly,
+    so reported distances stay true L2 and only recall is approximate.  With
+    ``rerank=0`` the ANN index's own (possibly quantised) distances are
+    returned and ``vectors.npy`` is never paged in, so only the ANN index
+    needs to stay in memory.  ``rerank`` defaults to the ``ann_rerank`` the
+    build recorded, else ``ANN_RERANK``.  ``search_params`` tunes the ANN
+    index (e.g. ``"nprobe=16"``).
+    """
+
+    def __init__(self, path, search_params=None, rerank=None):
+        # Read every file from the version ``path`` points at now, even if a
+        # build switches it while they are being opened
+        self.path = path = os.path.realpath(path)
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.rerank = (rerank if rerank is not None else
+                       self.meta.get("ann_rerank", ANN_RERANK))
+        if self.meta.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format: {self.meta}")
+        mmap = "r" if self.meta["count"] else None
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap)
+        self.norms = np.load(os.path.join(path, "norms.npy"), mmap_mode=mmap)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.chunk_docs = np.load(os.path.join(path, "chunk_docs.npy"))
+        with open(os.path.join(path, "documents.json")) as f:
+            self.documents = json.load(f)
+        if self.offsets[-1]:
+            self._text = np.memmap(os.path.join(path, "chunks.bin"),
+                                   dtype=np.uint8, mode="r")
+        else:
+            self._text = np.zeros(0, dtype=np.uint8)
+        self.ann = None
+        ann_path = os.path.join(path, ANN_INDEX_FILE)
+        if faiss is not None and os.path.exists(ann_path):
+            self.ann = faiss.read_index(ann_path)
+            set_search_params(self.ann, search_params)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        return cls(path, **kwargs)
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def metadata(self, i):
+        return self.documents[self.chunk_docs[i]]
+
+    def chunk(self, i):
+        """Return chunk ``i`` as a ``Document`` with its file's metadata."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        text = self._text[start:end].tobytes().decode("utf-8")
+        return Document(page_content=text, metadata=dict(self.metadata(i)))
+
+    def distances(self, embedding):
+        """Squared L2 distance from ``embedding`` to every stored vector."""
+        query = np.asarray(embedding, dtype=np.float32)
+        out = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK],
+                               dtype=np.float32)
+            out[start:start + len(block)] = (
+                self.norms[start:start + len(block)] - 2 * (block @ query))
+        return np.maximum(out + query @ query, 0)
+
+    def distances_to(self, rows, embedding):
+        """Squared L2 distance from ``embedding`` to the vectors at ``rows``."""
+        query = np.asarray(embedding, dtype=np.float32)
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        return np.maximum(self.norms[rows] - 2 * (block @ query) + query @ query,
+                          0)
+
+    def search(self, embedding, k=4):
+        """Return ``(rows, distances)`` of the ``k`` closest chunks, closest
+        first; approximate when an ANN index is loaded."""
+        if not len(self):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if self.ann is None:
+            scores = self.distances(embedding)
+            rows = np.arange(len(scores))
+        else:
+            query = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+            found, ids = self.ann.search(
+                query, min(k * max(self.rerank, 1), len(self)))
+            if not self.rerank:
+                keep = ids[0] >= 0
+                return ids[0][keep][:k], found[0][keep][:k]
+            rows = np.sort(ids[0][ids[0] >= 0])
+            scores = self.distances_to(rows, embedding)
+        k = min(k, len(rows))
+        if not k:
+            return rows, scores
+        top = np.argpartition(scores, k - 1)[:k]
+        top = top[np.argsort(scores[top], kind="stable")]
+        return rows[top], scores[top]
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+        rows, scores = self.search(embedding, k)
+        return [(self.chunk(i), float(s)) for i, s in zip(rows, scores)]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in
+                self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def without_sources(self, sources):
+        """Return ``(docs, vectors)`` for every chunk not from ``sources``.
+
+        Used by incremental builds to carry unchanged chunks over to the next
+        index without re-embedding them.
+        """
+        keep = [i for i in range(len(self))
+                if self.metadata(i).get("source") not in sources]
+        vectors = np.asarray(self.vectors[keep], dtype=self.vectors.dtype)
+        return [self.chunk(i) for i in keep], vectors
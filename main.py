@@ -1,30 +1,123 @@
 import os
 import json
-import tempfile
+import time
+import hmac
+import itertools
+import threading
 import zipfile
-from io import BytesIO
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from collections import deque
+from io import BytesIO, RawIOBase
+from flask import (Flask, Response, request, jsonify, send_from_directory,
+                   send_file, stream_with_context)
 from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from dotenv import load_dotenv
-from azure.storage.blob import BlobServiceClient
 
 from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import OpenAIEmbeddings
-from langchain.chains import RetrievalQA
+from langchain.chains.question_answering import load_qa_chain
 from langchain_openai import ChatOpenAI
 
+from blob_store import (BlobCache, BundleCache, blob_etags,
+                        get_container_client, open_blob)
+from bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+from embedding_dispatcher import EmbeddingDispatcher
+from index_manager import IndexManager
+from index_store import IndexStore, index_exists
+from pathway_matcher import PathwayMatcher
+from query_cache import (QueryCache, SQLiteCacheBackend, SemanticCache,
+                         literal_terms, normalise_query)
+
 # ── Load environment variables ──
 load_dotenv()
 
 app = Flask(__name__, static_folder="static")
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 MAX_DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "3"))
+# Stream ZIP downloads as they are built; 0 buffers the whole archive first.
+ZIP_STREAMING = os.getenv("ZIP_STREAMING", "1") == "1"
+
+# ── /ask stage execution ──
+# The QA answer, document links and pathway match are independent, so by
+# default they run side by side.  The answer runs on its own pool so that
+# slow model calls never queue the cheap search stages behind them.  Each
+# stage has its own deadline; a stage that misses it or fails is replaced by
+# its fallback value.
+ASK_PARALLEL = os.getenv("ASK_PARALLEL", "1") == "1"
+ASK_WORKERS = int(os.getenv("ASK_WORKERS", "12"))
+ASK_REPLY_WORKERS = int(os.getenv("ASK_REPLY_WORKERS", str(ASK_WORKERS)))
+STAGE_TIMEOUTS = {
+    "reply": float(os.getenv("ASK_REPLY_TIMEOUT", "30")),
+    "downloads": float(os.getenv("ASK_DOWNLOADS_TIMEOUT", "10")),
+    "pathways": float(os.getenv("ASK_PATHWAYS_TIMEOUT", "10")),
+}
+STAGE_FALLBACKS = {
+    "reply": "Sorry, the assistant is taking too long to respond. "
+             "Please try again in a moment.",
+    "downloads": [],
+    "pathways": [],
+}
+STAGE_EXECUTOR = ThreadPoolExecutor(max_workers=ASK_WORKERS,
+                                    thread_name_prefix="ask-stage")
+REPLY_EXECUTOR = ThreadPoolExecutor(max_workers=ASK_REPLY_WORKERS,
+                                    thread_name_prefix="ask-reply")
+
+# Model calls give up on their own within the reply deadline (retries
+# included), so a reply abandoned by run_stages frees its worker soon after.
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "1"))
+OPENAI_TIMEOUT = float(os.getenv(
+    "OPENAI_TIMEOUT",
+    str(STAGE_TIMEOUTS["reply"] / (OPENAI_MAX_RETRIES + 1))))
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"),
+                timeout=OPENAI_TIMEOUT,
+                max_retries=OPENAI_MAX_RETRIES)
+
+# ── Query cache ──
+# Query embeddings and ranked links/pathways keyed by the normalised query
+# text.  Set QUERY_CACHE_DB to a local SQLite path to share hits between
+# workers on the same host.
+QUERY_CACHE_DB = os.getenv("QUERY_CACHE_DB")
+QUERY_CACHE = QueryCache(
+    max_entries=int(os.getenv("QUERY_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+    backend=SQLiteCacheBackend(QUERY_CACHE_DB) if QUERY_CACHE_DB else None)
+
+# Answers from the QA chain, reused for near-identical questions against the
+# same index version.
+ANSWER_CACHE = SemanticCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.98")),
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "500")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", "86400")))
 
 # ── Azure Blob Storage Settings ──
 AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 AZURE_CONTAINER_NAME = "resources"
 AZURE_BLOB_BASE_URL = f"https://embeddingassistantfiles.blob.core.windows.net/{AZURE_CONTAINER_NAME}/"
+BLOB_POOL_SIZE = int(os.getenv("BLOB_POOL_SIZE", str(MAX_DOWNLOAD_WORKERS)))
+
+
+# Optional local disk cache of blobs, revalidated by ETag on every use (or
+# only after BLOB_CACHE_REVALIDATE seconds).  Enabled by BLOB_CACHE_DIR.
+BLOB_CACHE_DIR = os.getenv("BLOB_CACHE_DIR")
+BLOB_CACHE = BlobCache(
+    BLOB_CACHE_DIR,
+    max_bytes=int(os.getenv("BLOB_CACHE_MB", "1024")) * 1024 * 1024,
+    revalidate_after=float(os.getenv("BLOB_CACHE_REVALIDATE", "0")),
+) if BLOB_CACHE_DIR else None
+
+
+# Optional cache of finished ZIP bundles for repeated file selections.
+BUNDLE_CACHE_DIR = os.getenv("BUNDLE_CACHE_DIR")
+BUNDLE_CACHE = BundleCache(
+    BUNDLE_CACHE_DIR,
+    max_bytes=int(os.getenv("BUNDLE_CACHE_MB", "512")) * 1024 * 1024,
+) if BUNDLE_CACHE_DIR else None
+
+
+def blob_container():
+    """Shared, lazily created client for the resources container."""
+    return get_container_client(AZURE_STORAGE_CONNECTION_STRING,
+                                AZURE_CONTAINER_NAME,
+                                pool_size=BLOB_POOL_SIZE)
 
 # ── System Prompt ──
 SYSTEM_PERSONA = """
@@ -48,29 +141,276 @@ You are familiar with UK Higher Education policies, career services, graduate em
 Limit your responses to 200 words excluding download links and pathway suggestions.
 """
 
-# ── Load Document Vector Index ──
+# ── Shared embeddings client (one per process, reused by every index) ──
+EMBEDDINGS = OpenAIEmbeddings()
+
+# Query embeddings from concurrent requests are sent together: while a call
+# is in flight, new queries wait up to QUERY_EMBED_WINDOW_MS (or until
+# QUERY_EMBED_BATCH are queued) and go out as one batch.
+QUERY_EMBED_WINDOW_MS = float(os.getenv("QUERY_EMBED_WINDOW_MS", "5"))
+QUERY_EMBED_BATCH = int(os.getenv("QUERY_EMBED_BATCH", "64"))
+QUERY_EMBED_CONCURRENCY = int(os.getenv("QUERY_EMBED_CONCURRENCY", "4"))
+
+
+def _embed_queries(texts):
+    return EMBEDDINGS.embed_documents(texts)
+
+
+QUERY_EMBEDDER = EmbeddingDispatcher(_embed_queries,
+                                     window=QUERY_EMBED_WINDOW_MS / 1000,
+                                     max_batch=QUERY_EMBED_BATCH,
+                                     max_in_flight=QUERY_EMBED_CONCURRENCY)
+
+QA_CONTEXT_K = 4  # chunks stuffed into the QA prompt, as the default retriever did
+LINK_CANDIDATES = 15  # hits taken from each retriever before ranking links
+# One vector search per request serves both: the best QA_CONTEXT_K chunks
+# become the answer's context and all of them are ranked into download links.
+RETRIEVAL_K = max(QA_CONTEXT_K, LINK_CANDIDATES)
+
+# Compact memory-mapped index from vector_build.py; the pickle-based FAISS
+# index in LEGACY_INDEX_DIR is only read when it has not been built yet.
+DOCUMENT_STORE_DIR = os.getenv("DOCUMENT_INDEX_DIR", "document_index")
+LEGACY_INDEX_DIR = "faiss_index"
+# FAISS search parameters for an ANN index built with INDEX_ANN, e.g.
+# "nprobe=16" for IVF or "efSearch=64" for HNSW
+ANN_SEARCH_PARAMS = os.getenv("ANN_SEARCH_PARAMS", "")
+# ANN candidates re-scored exactly per result; 0 uses the ANN distances and
+# leaves the vectors on disk.  Unset keeps the value the build recorded.
+ANN_RERANK = (int(os.environ["ANN_RERANK"]) if os.getenv("ANN_RERANK")
+              else None)
+PATHWAY_INDEX_DIR = "pathways_index"
+# Pathway matrix and keywords written by build_pathway_index.py
+PATHWAY_MATCHER_FILE = os.path.join(PATHWAY_INDEX_DIR, "pathways.npz")
+# BM25 index written next to each vector index by the build scripts
+LEXICAL_INDEX_FILE = "lexical.npz"
+# Queries of at most this many terms, all known to the BM25 index, are
+# answered from it alone without an embedding call
+LEXICAL_ONLY_MAX_TERMS = int(os.getenv("LEXICAL_ONLY_MAX_TERMS", "3"))
+
+
+# ── Document Catalogue ──
+# One entry per source file (summary, tags, general flag, blob URL), built
+# once per loaded index so ranking joins against it instead of rescanning
+# every chunk in the docstore on each request.
+class DocumentCatalogue:
+    def __init__(self, index, entries):
+        self.index = index
+        self.entries = entries
+        self.general = [e for e in entries.values() if e["is_general"]]
+
+
+def _source_name(metadata):
+    return os.path.basename(metadata.get("source", ""))
+
+
+def _catalogue_entry(metadata):
+    tags = list(metadata.get("tags", []))
+    fname = _source_name(metadata)
+    return {
+        "name": fname,
+        "url": f"{AZURE_BLOB_BASE_URL}{fname}",
+        "summary": metadata.get("summary", ""),
+        "tags": tags,
+        "is_general": "general" in tags or "main" in tags,
+    }
+
+
+def build_document_catalogue(index):
+    """Collapse the chunk-level docstore of ``index`` into per-file entries.
+
+    A compact ``IndexStore`` already keeps one metadata row per file, so its
+    ``documents`` table is used directly.
+    """
+    entries = {}
+    if isinstance(index, IndexStore):
+        metadatas = index.documents
+    else:
+        docstore = getattr(index, "docstore", None)
+        metadatas = (doc.metadata for doc in getattr(docstore, "_dict", {}).values())
+    for metadata in metadatas:
+        fname = _source_name(metadata)
+        if fname and fname not in entries:
+            entries[fname] = _catalogue_entry(metadata)
+    return DocumentCatalogue(index, entries)
+
+
+def load_document_index():
+    if index_exists(DOCUMENT_STORE_DIR):
+        return IndexStore.load(DOCUMENT_STORE_DIR,
+                               search_params=ANN_SEARCH_PARAMS,
+                               rerank=ANN_RERANK)
+    return FAISS.load_local(LEGACY_INDEX_DIR,
+                            EMBEDDINGS,
+                            allow_dangerous_deserialization=True)
+
+
+def load_pathway_index():
+    """Load the pathway matcher, converting an older FAISS pathway index
+    (with keywords taken from pathways.json) when that is all there is."""
+    if os.path.exists(PATHWAY_MATCHER_FILE):
+        return PathwayMatcher.load(PATHWAY_MATCHER_FILE)
+    db = FAISS.load_local(PATHWAY_INDEX_DIR,
+                          EMBEDDINGS,
+                          allow_dangerous_deserialization=True)
+    try:
+        with open("pathways.json", encoding="utf-8") as f:
+            catalogue = json.load(f)
+    except (OSError, ValueError):
+        catalogue = []
+    return PathwayMatcher.from_faiss(db, catalogue)
+
+
+def load_lexical_index(index_dir):
+    """Load the BM25 index in ``index_dir``, or ``None`` if it has none."""
+    path = os.path.join(index_dir, LEXICAL_INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        return BM25Index.load(path)
+    except Exception as e:
+        print(f"⚠️ Could not load lexical index {path}: {e}")
+        return None
+
+
+class IndexSnapshot:
+    """The document and pathway indexes loaded from one version on disk.
+
+    Each request takes the snapshot that is current when it starts and uses
+    it for every stage, so a reload never mixes two versions in one answer.
+    """
+
+    def __init__(self, version, documents=None, pathways=None, lexical=None):
+        self.version = version
+        self.documents = documents
+        self.pathways = pathways
+        self.lexical = lexical
+        self.catalogue = build_document_catalogue(documents)
+
+
+def load_indexes(version, previous=None):
+    """Load both indexes; one that fails keeps its ``previous`` copy."""
+    try:
+        if (previous is not None and isinstance(previous.documents, IndexStore)
+                and not index_exists(DOCUMENT_STORE_DIR)):
+            # Never fall back from a compact index to the stale legacy pickle
+            raise FileNotFoundError(f"{DOCUMENT_STORE_DIR} is missing")
+        documents = load_document_index()
+        lexical = None
+        if isinstance(documents, IndexStore):
+            # The version directory the store resolved, not the symlink
+            lexical = load_lexical_index(documents.path)
+        print("✅ Document index loaded")
+    except Exception as e:
+        print(f"⚠️ Could not load document index: {e}")
+        documents = previous.documents if previous else None
+        lexical = previous.lexical if previous else None
+
+    try:
+        pathways = load_pathway_index()
+        print("✅ pathways_index loaded")
+    except Exception as e:
+        print(f"⚠️ Could not load pathways_index: {e}")
+        pathways = previous.pathways if previous else None
+
+    return IndexSnapshot(version, documents, pathways, lexical)
+
+
 try:
-    VECTOR_INDEX = FAISS.load_local("faiss_index",
-                                    OpenAIEmbeddings(),
-                                    allow_dangerous_deserialization=True)
-    QA_CHAIN = RetrievalQA.from_chain_type(
-        llm=ChatOpenAI(model="gpt-3.5-turbo"),  # 🟢 Downgraded to save cost
-        retriever=VECTOR_INDEX.as_retriever())
-    print("✅ FAISS document index loaded")
+    QA_LLM = ChatOpenAI(model="gpt-3.5-turbo",  # 🟢 Downgraded to save cost
+                        timeout=OPENAI_TIMEOUT,
+                        max_retries=OPENAI_MAX_RETRIES)
+    QA_CHAIN = load_qa_chain(QA_LLM, chain_type="stuff")
 except Exception as e:
-    print(f"⚠️ Could not load FAISS document index: {e}")
-    VECTOR_INDEX = None
+    print(f"⚠️ Could not create QA chain: {e}")
+    QA_LLM = None
     QA_CHAIN = None
 
-# ── Load Pathway Vector Index ──
-try:
-    PATHWAY_INDEX = FAISS.load_local("pathways_index",
-                                     OpenAIEmbeddings(),
-                                     allow_dangerous_deserialization=True)
-    print("✅ pathways_index loaded")
-except Exception as e:
-    print(f"⚠️ Could not load pathways_index: {e}")
-    PATHWAY_INDEX = None
+# ── Load Indexes ──
+# Rebuilt index files are picked up without a restart: the watcher polls
+# their fingerprint every INDEX_RELOAD_INTERVAL seconds (0 disables it) and
+# POST /admin/reload forces a check.  Both load the new version in the
+# background and swap it in atomically.
+INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", "30"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+INDEXES = IndexManager(load_indexes,
+                       [DOCUMENT_STORE_DIR, LEGACY_INDEX_DIR, PATHWAY_INDEX_DIR])
+INDEXES.reload()
+INDEXES.watch(INDEX_RELOAD_INTERVAL)
+
+
+class QueryContext:
+    """Per-request view of the user's query.
+
+    The embedding is computed lazily on first access and then shared by the
+    QA context lookup, the document-link ranking and the pathway matcher, so
+    each request makes at most one embeddings call.  Likewise ``hits`` runs
+    the document vector search once and both the answer and the download
+    links are built from its results.
+    """
+
+    def __init__(self, text, answering=False):
+        self.text = text
+        # Set when a QA stage answers this query, so the vector search runs
+        self.answering = answering
+        self.indexes = INDEXES.current
+        self._embedding = None
+        self._hits = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def of(cls, query):
+        """Wrap a plain query string; pass existing contexts through."""
+        return query if isinstance(query, cls) else cls(query)
+
+    @property
+    def embedding(self):
+        # Stages may ask for the vector concurrently; only one of them embeds.
+        if self._embedding is None:
+            with self._lock:
+                if self._embedding is None:
+                    self._embedding = self._cached_embedding()
+        return self._embedding
+
+    @property
+    def hits(self):
+        """``(chunk, distance)`` pairs for the top ``RETRIEVAL_K`` chunks of
+        the document index, closest first."""
+        if self._hits is None:
+            with self._lock:
+                if self._hits is None:
+                    documents = self.indexes.documents
+                    self._hits = documents.similarity_search_with_score_by_vector(
+                        self.embedding, k=RETRIEVAL_K)
+        return self._hits
+
+    def search_planned(self):
+        """True when the vector search runs for this request anyway, so link
+        ranking can use its hits at no extra cost."""
+        return self.answering or self._hits is not None
+
+    def context_docs(self):
+        """The chunks the answer is grounded in."""
+        return [doc for doc, _ in self.hits[:QA_CONTEXT_K]]
+
+    def _cached_embedding(self):
+        key = f"embedding|{normalise_query(self.text)}"
+        embedding = QUERY_CACHE.get(key)
+        if embedding is None:
+            embedding = QUERY_EMBEDDER.embed(self.text)
+            QUERY_CACHE.set(key, embedding)
+        return embedding
+
+    def answerable_lexically(self, lexical):
+        """True for short queries whose every term is in the BM25 index
+        ``lexical``; these are ranked from it without an embedding."""
+        terms = tokenize(self.text)
+        return (lexical is not None and 0 < len(terms) <= LEXICAL_ONLY_MAX_TERMS
+                and all(t in lexical.vocab for t in terms))
+
+    def cache_key(self, kind, *parts):
+        """Key for a cached result derived from this query and the loaded index."""
+        return "|".join([kind, self.indexes.version, *map(str, parts),
+                         normalise_query(self.text)])
 
 
 @app.route("/")
@@ -83,123 +423,339 @@ def serve_static(filename):
     return send_from_directory(app.static_folder, filename)
 
 
+@app.route("/cache/stats")
+def cache_stats():
+    return jsonify({"index_version": INDEXES.current.version,
+                    "indexes": INDEXES.stats(),
+                    "query_embeddings": QUERY_EMBEDDER.stats(),
+                    "query_cache": QUERY_CACHE.stats(),
+                    "answer_cache": ANSWER_CACHE.stats(),
+                    "blob_cache": BLOB_CACHE.stats() if BLOB_CACHE else None,
+                    "bundle_cache":
+                    BUNDLE_CACHE.stats() if BUNDLE_CACHE else None})
+
+
+@app.route("/admin/reload", methods=["POST"])
+def admin_reload():
+    """Reload the indexes if their files changed; ``?force=1`` always does.
+
+    Requires ``Authorization: Bearer <ADMIN_TOKEN>`` and is disabled while
+    ADMIN_TOKEN is unset.  Only the worker that receives the call reloads;
+    the others pick the change up through their watcher.
+    """
+    auth = request.headers.get("Authorization", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(auth, f"Bearer {ADMIN_TOKEN}"):
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        reloaded = INDEXES.reload(force=request.args.get("force") == "1")
+    except Exception as e:
+        print(f"❌ Index reload failed: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+    return jsonify({"reloaded": reloaded, "index_version": INDEXES.current.version})
+
+
 @app.route("/ask", methods=["POST"])
 def ask_gpt():
     data = request.get_json()
     user_message = data.get("message", "").lower()
-
-    if QA_CHAIN:
-        answer = QA_CHAIN.run(user_message)
-        file_links = get_links_with_summaries(user_message)
+    query = QueryContext(user_message)
+
+    if has_document_index(query):
+        query.answering = True
+        stages = {
+            "reply": answer_question,
+            "downloads": get_links_with_summaries,
+            "pathways": match_pathways,
+        }
     else:
-        gpt_resp = client.chat.completions.create(
-            model="gpt-3.5-turbo",  # 🟢 Also changed here
-            messages=[{
-                "role": "system",
-                "content": SYSTEM_PERSONA
-            }, {
-                "role": "user",
-                "content": user_message
-            }],
-            max_tokens=500)
-        answer = gpt_resp.choices[0].message.content
-        file_links = []
-
-    matched_pathways = match_pathways(user_message)
-
-    return jsonify({
-        "reply": answer,
-        "downloads": file_links,
-        "pathways": matched_pathways
-    })
+        stages = {
+            "reply": answer_without_index,
+            "downloads": lambda q: [],
+            "pathways": match_pathways,
+        }
+
+    return jsonify(run_stages(stages, query))
+
+
+@app.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    """Server-Sent Events variant of /ask.
+
+    Download links and pathways are pushed as soon as retrieval finishes,
+    followed by the answer as ``token`` events while the model generates it.
+    """
+    data = request.get_json()
+    user_message = data.get("message", "").lower()
+    query = QueryContext(user_message)
+    return Response(stream_with_context(_ask_events(query)),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache",
+                             "X-Accel-Buffering": "no"})
+
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def _ask_events(query):
+    stages = {"pathways": match_pathways}
+    indexed = has_document_index(query)
+    if indexed:
+        query.answering = True
+        stages["downloads"] = get_links_with_summaries
+    retrieved = run_stages(stages, query)
+    yield _sse("downloads", retrieved.get("downloads", []))
+    yield _sse("pathways", retrieved["pathways"])
+
+    try:
+        tokens = stream_answer if indexed else stream_answer_without_index
+        for token in tokens(query):
+            if token:
+                yield _sse("token", token)
+    except Exception as e:
+        print(f"❌ Streaming answer failed: {e}")
+        yield _sse("error", "The assistant could not finish its answer.")
+    yield _sse("done", {})
+
+
+def run_stages(stages, query):
+    """Run the independent /ask stages for ``query`` and collect their results.
+
+    In parallel mode every stage is submitted at once, the answer to
+    ``REPLY_EXECUTOR`` and the searches to ``STAGE_EXECUTOR``, and its
+    deadline is measured from that moment, so a slow search never holds the
+    reply back for longer than its own timeout.  A stage that times out or
+    raises is replaced by its ``STAGE_FALLBACKS`` value; the others are kept.
+    """
+    if not ASK_PARALLEL:
+        return {name: _run_stage(name, fn, query) for name, fn in stages.items()}
+
+    start = time.monotonic()
+    futures = {name: (REPLY_EXECUTOR if name == "reply" else
+                      STAGE_EXECUTOR).submit(fn, query)
+               for name, fn in stages.items()}
+    results = {}
+    for name, future in futures.items():
+        remaining = start + STAGE_TIMEOUTS[name] - time.monotonic()
+        try:
+            results[name] = future.result(timeout=max(remaining, 0))
+        except TimeoutError:
+            future.cancel()
+            print(f"⚠️ /ask stage '{name}' timed out; returning fallback")
+            results[name] = STAGE_FALLBACKS[name]
+        except Exception as e:
+            print(f"❌ /ask stage '{name}' failed: {e}; returning fallback")
+            results[name] = STAGE_FALLBACKS[name]
+    return results
+
+
+def _run_stage(name, fn, query):
+    try:
+        return fn(query)
+    except Exception as e:
+        print(f"❌ /ask stage '{name}' failed: {e}; returning fallback")
+        return STAGE_FALLBACKS[name]
+
+
+def has_document_index(query):
+    return QA_CHAIN is not None and query.indexes.documents is not None
+
+
+def answer_without_index(query):
+    """Answer directly with the chat model when no document index is loaded."""
+    ctx = QueryContext.of(query)
+    gpt_resp = client.chat.completions.create(
+        model="gpt-3.5-turbo",  # 🟢 Also changed here
+        messages=[{
+            "role": "system",
+            "content": SYSTEM_PERSONA
+        }, {
+            "role": "user",
+            "content": ctx.text
+        }],
+        max_tokens=500)
+    return gpt_resp.choices[0].message.content
+
+
+def answer_question(query):
+    """Answer ``query`` with the QA chain using chunks found by its embedding."""
+    ctx = QueryContext.of(query)
+    version = ctx.indexes.version
+    literals = literal_terms(ctx.text)
+    answer = ANSWER_CACHE.lookup(ctx.embedding, version, literals)
+    if answer is None:
+        answer = QA_CHAIN.run(input_documents=ctx.context_docs(),
+                              question=ctx.text)
+        ANSWER_CACHE.add(ctx.embedding, answer, version, literals)
+    return answer
+
+
+def stream_answer(query):
+    """Yield the QA answer for ``query`` chunk by chunk as the model writes it."""
+    ctx = QueryContext.of(query)
+    version = ctx.indexes.version
+    literals = literal_terms(ctx.text)
+    answer = ANSWER_CACHE.lookup(ctx.embedding, version, literals)
+    if answer is not None:
+        yield answer
+        return
+
+    docs = ctx.context_docs()
+    # Same prompt the stuff chain would build, sent through the streaming API
+    context = QA_CHAIN.document_separator.join(d.page_content for d in docs)
+    messages = QA_CHAIN.llm_chain.prompt.format_messages(
+        **{QA_CHAIN.document_variable_name: context, "question": ctx.text})
+    parts = []
+    for chunk in QA_LLM.stream(messages):
+        parts.append(chunk.content)
+        yield chunk.content
+    ANSWER_CACHE.add(ctx.embedding, "".join(parts), version, literals)
+
+
+def stream_answer_without_index(query):
+    """Streaming counterpart of ``answer_without_index``."""
+    ctx = QueryContext.of(query)
+    stream = client.chat.completions.create(
+        model="gpt-3.5-turbo",
+        messages=[{
+            "role": "system",
+            "content": SYSTEM_PERSONA
+        }, {
+            "role": "user",
+            "content": ctx.text
+        }],
+        max_tokens=500,
+        stream=True)
+    for chunk in stream:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content
 
 
 def get_links_with_summaries(query, top_k: int = 6):
     """Return document links sorted by FAISS score, always including general docs."""
+    ctx = QueryContext.of(query)
+    # Lexical-only and fused rankings of the same query are cached apart
+    key = ctx.cache_key("links", top_k, int(ctx.search_planned()))
+    links = QUERY_CACHE.get(key)
+    if links is None:
+        links = _rank_links(ctx, top_k)
+        if links is not None:
+            QUERY_CACHE.set(key, links)
+    return links or []
+
+
+def _rank_links(ctx, top_k):
     results = []
     seen = set()
 
     try:
-        # Request scores from FAISS for query-specific results
-        ranked_docs = VECTOR_INDEX.similarity_search_with_score(query, k=15)
-
-        # Fetch general docs by filtering metadata tags
-        doc_dict = getattr(VECTOR_INDEX.docstore, "_dict", {})
-        general_docs = [
-            (doc, float("inf"))
-            for doc in doc_dict.values()
-            if "general" in doc.metadata.get("tags", [])
-            or "main" in doc.metadata.get("tags", [])
-        ]
-
-        # Combine all docs then apply heuristic re-ranking
-        combined = ranked_docs + general_docs
-
-        def _heuristic(doc_score):
-            """Return adjusted score based on simple keyword heuristics."""
-            doc, score = doc_score
-            adj = score
-            summary = doc.metadata.get("summary", "").lower()
-            name = os.path.basename(doc.metadata.get("source", "")).lower()
-            q = query.lower()
-            if q:
-                if q in summary or q in name:
-                    adj -= 0.2  # boost if query appears
-            if "general" in doc.metadata.get("tags", []) or "main" in doc.metadata.get("tags", []):
-                adj += 1.0  # demote general docs slightly
-            return adj
-
-        combined.sort(key=_heuristic)
-
-        for doc, score in combined:
-            fname = os.path.basename(doc.metadata.get("source", ""))
-            summary = doc.metadata.get("summary", "")
-            if fname and fname not in seen:
-                seen.add(fname)
-                results.append({
-                    "name": fname,
-                    "url": f"{AZURE_BLOB_BASE_URL}{fname}",
-                    "summary": summary,
-                    "_score": score,
-                    "_is_general": "general" in doc.metadata.get("tags", [])
-                    or "main" in doc.metadata.get("tags", [])
-                })
+        if ctx.indexes.lexical is not None:
+            ranked = _fused_ranking(ctx)
+        else:
+            ranked = _heuristic_ranking(ctx)
+
+        for entry in ranked:
+            if entry["name"] and entry["name"] not in seen:
+                seen.add(entry["name"])
+                results.append(entry)
 
         # Trim to top_k then append any missing general docs
         top_results = results[:top_k]
         included = {r["name"] for r in top_results}
-        for item in results[top_k:]:
-            if item["_is_general"] and item["name"] not in included:
-                top_results.append(item)
-                included.add(item["name"])
-
-        # Remove helper keys
-        for item in top_results:
-            item.pop("_score", None)
-            item.pop("_is_general", None)
+        for entry in results[top_k:]:
+            if entry["is_general"] and entry["name"] not in included:
+                top_results.append(entry)
+                included.add(entry["name"])
 
-        return top_results
+        return [{
+            "name": entry["name"],
+            "url": entry["url"],
+            "summary": entry["summary"]
+        } for entry in top_results]
 
     except Exception as e:
         print(f"⚠️ Failed to fetch summary metadata: {e}")
-        return []
+        return None
+
+
+def _fused_ranking(ctx):
+    """Catalogue entries ranked by reciprocal-rank fusion of BM25 and vector
+    search.  Keyword queries fully covered by the BM25 index skip the vector
+    search (and the embedding call) when they match anything, unless the
+    request searches anyway to answer the question: then the links are
+    ranked from the same chunks the answer uses."""
+    lexical = ctx.indexes.lexical
+    catalogue = ctx.indexes.catalogue
+    lexical_hits = [_source_name({"source": lexical.keys[i]})
+                    for i, _ in lexical.search(ctx.text, k=LINK_CANDIDATES)]
+
+    vector_hits = []
+    if ctx.search_planned() or not (lexical_hits
+                                    and ctx.answerable_lexically(lexical)):
+        vector_hits = [_source_name(doc.metadata) for doc, _ in ctx.hits]
+
+    fused = reciprocal_rank_fusion([vector_hits, lexical_hits])
+    entries = [catalogue.entries[name] for name in fused
+               if name in catalogue.entries]
+    # General docs follow the specific matches, then any not matched at all
+    entries.sort(key=lambda entry: entry["is_general"])
+    return entries + catalogue.general
+
+
+def _heuristic_ranking(ctx):
+    """Catalogue entries ranked by vector distance with a substring boost,
+    for indexes built before the BM25 index existed."""
+    query = ctx.text
+    # Scored chunks from the request's shared vector search
+    ranked_docs = ctx.hits
+
+    # Join the hits against the document catalogue; general docs come
+    # straight from its precomputed list instead of a docstore scan.
+    catalogue = ctx.indexes.catalogue
+    combined = [(catalogue.entries.get(_source_name(doc.metadata))
+                 or _catalogue_entry(doc.metadata), score)
+                for doc, score in ranked_docs]
+    combined += [(entry, float("inf")) for entry in catalogue.general]
+
+    def _heuristic(entry_score):
+        """Return adjusted score based on simple keyword heuristics."""
+        entry, score = entry_score
+        adj = score
+        q = query.lower()
+        if q:
+            if q in entry["summary"].lower() or q in entry["name"].lower():
+                adj -= 0.2  # boost if query appears
+        if entry["is_general"]:
+            adj += 1.0  # demote general docs slightly
+        return adj
+
+    combined.sort(key=_heuristic)
+    return [entry for entry, _ in combined]
 
 
 def match_pathways(user_input):
-    if not PATHWAY_INDEX:
+    ctx = QueryContext.of(user_input)
+    if not ctx.indexes.pathways:
         return []
-    results = []
+    key = ctx.cache_key("pathways")
+    results = QUERY_CACHE.get(key)
+    if results is None:
+        results = _search_pathways(ctx)
+        if results is not None:
+            QUERY_CACHE.set(key, results)
+    return results or []
+
+
+def _search_pathways(ctx):
+    matcher = ctx.indexes.pathways
     try:
-        docs = PATHWAY_INDEX.similarity_search(user_input, k=5)
-        for doc in docs:
-            md = doc.metadata
-            results.append({
-                "title": md.get("title", ""),
-                "description": md.get("description", ""),
-                "url": md.get("url", "")
-            })
+        # Keyword queries are matched without embedding the query
+        results = matcher.match(ctx.text, max_terms=LEXICAL_ONLY_MAX_TERMS)
+        if results is None:
+            results = matcher.match(ctx.text, ctx.embedding)
     except Exception as e:
         print(f"⚠️ Pathway search failed: {e}")
+        return None
     return results
 
 
@@ -212,44 +768,114 @@ def download_zip():
         return jsonify({"error": "No files provided"}), 400
 
     try:
-        blob_service = BlobServiceClient.from_connection_string(
-            AZURE_STORAGE_CONNECTION_STRING)
-        container = blob_service.get_container_client(AZURE_CONTAINER_NAME)
-
-        with tempfile.TemporaryDirectory() as tmpdir:
-            def download_one(fname):
-                path = os.path.join(tmpdir, fname)
-                data = container.get_blob_client(fname).download_blob().readall()
-                with open(path, "wb") as f:
-                    f.write(data)
-
-            with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor:
-                list(executor.map(download_one, files))
-
-            if pathways:
-                pfile = os.path.join(tmpdir, "pathways.txt")
-                with open(pfile, "w") as pf:
-                    for item in pathways:
-                        pf.write(f"Title: {item.get('title', '')}\n")
-                        pf.write(f"Description: {item.get('description', '')}\n")
-                        pf.write(f"URL: {item.get('url', '')}\n\n")
-
-            zip_buffer = BytesIO()
-            with zipfile.ZipFile(zip_buffer, "w") as zipf:
-                for fname in files:
-                    zipf.write(os.path.join(tmpdir, fname), arcname=fname)
-                if pathways:
-                    zipf.write(pfile, arcname="pathways.txt")
-
-            zip_buffer.seek(0)
-            return send_file(zip_buffer,
+        container = blob_container()
+
+        bundle_key = None
+        if BUNDLE_CACHE:
+            etags = blob_etags(container, files, MAX_DOWNLOAD_WORKERS)
+            bundle_key = BUNDLE_CACHE.key(files, etags, pathways)
+            cached = BUNDLE_CACHE.open(bundle_key)
+            if cached is not None:
+                return send_file(cached,
+                                 mimetype="application/zip",
+                                 as_attachment=True,
+                                 download_name="selected_resources.zip")
+
+        body = stream_zip(container, files, pathways)
+        if bundle_key:
+            body = BUNDLE_CACHE.store(bundle_key, body)
+
+        # Pull the first piece of the archive before answering so a broken
+        # connection or missing blob still produces a proper error status.
+        body = itertools.chain([next(body, b"")], body)
+
+        if not ZIP_STREAMING:
+            return send_file(BytesIO(b"".join(body)),
                              as_attachment=True,
                              download_name="selected_resources.zip")
 
+        return Response(stream_with_context(body),
+                        mimetype="application/zip",
+                        headers={
+                            "Content-Disposition":
+                            'attachment; filename="selected_resources.zip"'
+                        })
+
     except Exception as e:
         print(f"❌ ZIP creation failed: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
 
+class _ZipSink(RawIOBase):
+    """Write-only, unseekable target that hands zip output back in pieces."""
+
+    def __init__(self):
+        self._parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _blob_chunks(container, files):
+    """Yield ``(name, chunk_iterator)`` for each blob in ``files``, in order.
+
+    Up to ``MAX_DOWNLOAD_WORKERS`` downloads are opened ahead of the one being
+    consumed, so the next files are already in flight while the current one
+    is streamed out chunk by chunk.
+    """
+    executor = ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS)
+    try:
+        pending = deque()
+        names = iter(files)
+        for fname in itertools.islice(names, MAX_DOWNLOAD_WORKERS):
+            pending.append((fname, executor.submit(
+                open_blob, container, fname, BLOB_CACHE)))
+        while pending:
+            fname, future = pending.popleft()
+            for nxt in itertools.islice(names, 1):
+                pending.append((nxt, executor.submit(
+                    open_blob, container, nxt, BLOB_CACHE)))
+            yield fname, future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _pathways_text(pathways):
+    return "".join(f"Title: {item.get('title', '')}\n"
+                   f"Description: {item.get('description', '')}\n"
+                   f"URL: {item.get('url', '')}\n\n" for item in pathways)
+
+
+def stream_zip(container, files, pathways):
+    """Yield a ZIP archive of ``files`` (plus ``pathways.txt``) as it is built.
+
+    Each blob's download chunks are written straight into its zip entry, so
+    memory stays bounded per chunk and nothing is staged on disk.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w") as zipf:
+        for fname, chunks in _blob_chunks(container, files):
+            # Sizes are unknown up front and the sink cannot seek back, so
+            # every entry gets ZIP64 fields in case it passes 2 GiB
+            with zipf.open(fname, "w", force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+        if pathways:
+            zipf.writestr("pathways.txt", _pathways_text(pathways))
+    yield sink.drain()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,113 @@
+import json
+
+import numpy as np
+
+from bm25 import tokenize
+from index_store import faiss_rows
+
+# Weight of one matched keyword relative to cosine similarity (-1..1)
+KEYWORD_WEIGHT = 0.1
+
+
+class PathwayMatcher:
+    """Every pathway in memory, matched by cosine similarity and keywords.
+
+    Embeddings are held as one row-normalised NumPy matrix, so scoring all
+    pathways is a single matrix-vector product.  The curated ``keywords``
+    (and title words) of each entry form an inverted index; each query term
+    found there adds ``keyword_weight`` to that pathway's score.  A short
+    query made only of known keywords is answered from the inverted index
+    without needing a query embedding at all.
+    """
+
+    def __init__(self, entries, vectors, keyword_weight=KEYWORD_WEIGHT):
+        self.entries = list(entries)
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(self.entries), -1) if self.entries \
+                else matrix.reshape(0, 0)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms == 0, 1, norms)
+        self.keyword_weight = keyword_weight
+        postings = {}
+        for row, entry in enumerate(self.entries):
+            terms = tokenize(" ".join(entry.get("keywords", [])))
+            terms += tokenize(entry.get("title", ""))
+            for term in set(terms):
+                postings.setdefault(term, []).append(row)
+        self.keywords = {term: np.asarray(rows, dtype=np.int64)
+                         for term, rows in postings.items()}
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            entries = json.loads(str(data["entries"]))
+            return cls(entries, data["vectors"])
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f, vectors=self.matrix,
+                     entries=np.asarray(json.dumps(self.entries)))
+
+    @classmethod
+    def from_faiss(cls, db, catalogue=()):
+        """Build a matcher from a LangChain FAISS pathway index.
+
+        The FAISS metadata has no keywords, so they are joined back in from
+        ``catalogue`` (the ``pathways.json`` entries) by URL.
+        """
+        docs, vectors = faiss_rows(db)
+        keywords = {e.get("url"): e.get("keywords", []) for e in catalogue}
+        entries = [dict(doc.metadata,
+                        keywords=keywords.get(doc.metadata.get("url"), []))
+                   for doc in docs]
+        return cls(entries, vectors)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keyword_hits(self, query):
+        """Number of query terms that are keywords of each pathway."""
+        hits = np.zeros(len(self.entries), dtype=np.float32)
+        for term in set(tokenize(query)):
+            rows = self.keywords.get(term)
+            if rows is not None:
+                hits[rows] += 1
+        return hits
+
+    def is_keyword_query(self, query, max_terms=3):
+        terms = tokenize(query)
+        return 0 < len(terms) <= max_terms and all(
+            t in self.keywords for t in terms)
+
+    def match(self, query, embedding=None, k=5, max_terms=3):
+        """Return the top ``k`` pathways for ``query``.
+
+        Without an ``embedding`` only keyword queries can be answered; for
+        anything else ``None`` is returned and the caller should embed the
+        query and call again.
+        """
+        if not self.entries:
+            return []
+        hits = self.keyword_hits(query)
+        if embedding is None:
+            if not self.is_keyword_query(query, max_terms):
+                return None
+            scores = hits
+            candidates = np.flatnonzero(hits)
+        else:
+            vec = np.asarray(embedding, dtype=np.float32)
+            norm = np.linalg.norm(vec)
+            scores = self.matrix @ (vec / norm if norm else vec)
+            scores += self.keyword_weight * hits
+            candidates = np.arange(len(self.entries))
+
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates],
+                                                    k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [{
+            "title": self.entries[i].get("title", ""),
+            "description": self.entries[i].get("description", ""),
+            "url": self.entries[i].get("url", ""),
+        } for i in candidates]
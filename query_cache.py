@@ -0,0 +1,259 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalise_query(text):
+    """Collapse case and whitespace so trivially different queries share a key."""
+    return " ".join((text or "").lower().split())
+
+
+def literal_terms(text):
+    """Terms containing digits (levels, years, module codes such as
+    ``com1001``) that must match exactly for two queries to be equivalent."""
+    return frozenset(re.findall(r"[a-z]*\d[a-z0-9]*", (text or "").lower()))
+
+
+class SQLiteCacheBackend:
+    """Shared cache entries stored in a local SQLite file.
+
+    Several Gunicorn workers on the same host can point at the same file so a
+    value computed by one worker is a hit for the others.  Values must be JSON
+    serialisable.
+    """
+
+    def __init__(self, path, max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache ("
+                         "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                         "expires_at REAL NOT NULL, touched_at REAL NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?",
+                (key, )).fetchone()
+            if row is None:
+                return None, None
+            value, expires_at = row
+            if expires_at <= now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key, ))
+                return None, None
+            conn.execute("UPDATE cache SET touched_at = ? WHERE key = ?",
+                         (now, key))
+        return json.loads(value), expires_at
+
+    def set(self, key, value, expires_at):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now))
+            conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now, ))
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                "ORDER BY touched_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries, ))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+
+class QueryCache:
+    """Bounded in-process LRU cache with a per-entry TTL.
+
+    An optional ``backend`` (e.g. ``SQLiteCacheBackend``) is consulted on a
+    local miss and written through on every ``set`` so hits are shared
+    between processes.
+    """
+
+    def __init__(self, max_entries=256, ttl=3600, backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value for ``key`` or ``None`` on a miss."""
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.backend is not None and self.max_entries > 0:
+            try:
+                value, expires_at = self.backend.get(key)
+            except sqlite3.Error as e:
+                print(f"⚠️ Shared cache read failed: {e}")
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._store(key, value, expires_at)
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value, expires_at)
+            except sqlite3.Error as e:
+                print(f"⚠️ Shared cache write failed: {e}")
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry, locally and in the shared backend."""
+        with self._lock:
+            self._entries.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class SemanticCache:
+    """Answer cache matched on query-embedding cosine similarity.
+
+    Entries live in a fixed-size, row-normalised NumPy matrix so a lookup is a
+    single matrix-vector product.  An entry is reused when its similarity to
+    the new query reaches ``threshold`` and it was stored with the same
+    ``literals`` (see ``literal_terms``), since embeddings barely separate
+    "level 4 law" from "level 5 law"; entries expire after ``ttl`` seconds,
+    the least recently used one is overwritten when the matrix is full, and
+    everything is dropped when the document-index ``version`` changes.
+    """
+
+    def __init__(self, threshold=0.98, max_entries=500, ttl=86400):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._answers = [None] * max_entries
+        self._literals = [None] * max_entries
+        self._expires = np.zeros(max_entries)
+        self._used = np.zeros(max_entries)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalise(embedding):
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _reset(self, version):
+        self.version = version
+        self._vectors = None
+        self._answers = [None] * self.max_entries
+        self._literals = [None] * self.max_entries
+        self._expires[:] = 0
+        self._used[:] = 0
+
+    def lookup(self, embedding, version, literals=frozenset()):
+        """Return a cached answer for a similar query, or ``None``."""
+        if self.max_entries <= 0:
+            return None
+        vec = self._normalise(embedding)
+        now = time.time()
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            if self._vectors is None or self._vectors.shape[1] != vec.shape[0]:
+                self.misses += 1
+                return None
+            scores = self._vectors @ vec
+            scores[self._expires <= now] = -np.inf
+            candidates = np.flatnonzero(scores >= self.threshold)
+            candidates = candidates[np.argsort(-scores[candidates])]
+            best = next((int(i) for i in candidates
+                         if self._literals[i] == literals), None)
+            if best is None:
+                self.misses += 1
+                return None
+            self._used[best] = now
+            self.hits += 1
+            return self._answers[best]
+
+    def add(self, embedding, answer, version, literals=frozenset()):
+        if self.max_entries <= 0:
+            return
+        vec = self._normalise(embedding)
+        now = time.time()
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            if self._vectors is None or self._vectors.shape[1] != vec.shape[0]:
+                self._vectors = np.zeros((self.max_entries, vec.shape[0]),
+                                         dtype=np.float32)
+                self._expires[:] = 0
+            # Reuse an expired slot if there is one, else the least recently used
+            expired = np.flatnonzero(self._expires <= now)
+            slot = int(expired[0]) if expired.size else int(np.argmin(self._used))
+            self._vectors[slot] = vec
+            self._answers[slot] = answer
+            self._literals[slot] = frozenset(literals)
+            self._expires[slot] = now + self.ttl
+            self._used[slot] = now
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": int(np.count_nonzero(self._expires > time.time())),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
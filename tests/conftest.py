@@ -14,6 +14,8 @@ flask_mod.request = None
 flask_mod.jsonify = lambda *a, **k: {}
 flask_mod.send_from_directory = lambda *a, **k: None
 flask_mod.send_file = lambda *a, **k: None
+flask_mod.Response = lambda *a, **k: None
+flask_mod.stream_with_context = lambda gen: gen
 sys.modules.setdefault('flask', flask_mod)
 
 # Stub openai
@@ -44,6 +46,31 @@ sys.modules.setdefault('azure', azure_mod)
 sys.modules.setdefault('azure.storage', azure_storage_mod)
 sys.modules.setdefault('azure.storage.blob', azure_blob_mod)
 
+azure_core_mod = types.ModuleType('azure.core')
+class DummyMatchConditions:
+    IfModified = 'if-modified'
+azure_core_mod.MatchConditions = DummyMatchConditions
+azure_exceptions_mod = types.ModuleType('azure.core.exceptions')
+class DummyHttpResponseError(Exception):
+    def __init__(self, message=None, response=None, **kwargs):
+        super().__init__(message)
+        self.status_code = getattr(response, 'status_code', None)
+azure_exceptions_mod.HttpResponseError = DummyHttpResponseError
+azure_core_mod.exceptions = azure_exceptions_mod
+sys.modules.setdefault('azure.core.exceptions', azure_exceptions_mod)
+azure_pipeline_mod = types.ModuleType('azure.core.pipeline')
+azure_transport_mod = types.ModuleType('azure.core.pipeline.transport')
+class DummyRequestsTransport:
+    def __init__(self, *a, **k):
+        pass
+azure_transport_mod.RequestsTransport = DummyRequestsTransport
+azure_pipeline_mod.transport = azure_transport_mod
+azure_core_mod.pipeline = azure_pipeline_mod
+azure_mod.core = azure_core_mod
+sys.modules.setdefault('azure.core', azure_core_mod)
+sys.modules.setdefault('azure.core.pipeline', azure_pipeline_mod)
+sys.modules.setdefault('azure.core.pipeline.transport', azure_transport_mod)
+
 # Stub docx/pptx/PyPDF2
 Docx = types.ModuleType('docx')
 class DummyDocxDocument:
@@ -76,12 +103,19 @@ class DummyFAISS:
         return self
     def similarity_search(self, *a, **k):
         return []
+    def similarity_search_by_vector(self, *a, **k):
+        return []
+    def similarity_search_with_score_by_vector(self, *a, **k):
+        return []
 lc_vs_mod.FAISS = DummyFAISS
 sys.modules.setdefault('langchain_community.vectorstores', lc_vs_mod)
 
 lc_emb_mod = types.ModuleType('langchain_community.embeddings')
 class DummyEmbeddings:
-    pass
+    def embed_query(self, text):
+        return [0.0]
+    def embed_documents(self, texts):
+        return [[0.0] for _ in texts]
 lc_emb_mod.OpenAIEmbeddings = DummyEmbeddings
 sys.modules.setdefault('langchain_community.embeddings', lc_emb_mod)
 
@@ -116,13 +150,11 @@ class DummyDocument:
 lc_schema_mod.Document = DummyDocument
 sys.modules.setdefault('langchain.schema', lc_schema_mod)
 
-lc_chains_mod = types.ModuleType('langchain.chains')
-class DummyRetrievalQA:
-    @classmethod
-    def from_chain_type(cls, llm=None, retriever=None):
-        class Chain:
-            def run(self, query):
-                return ''
-        return Chain()
-lc_chains_mod.RetrievalQA = DummyRetrievalQA
-sys.modules.setdefault('langchain.chains', lc_chains_mod)
+lc_qa_mod = types.ModuleType('langchain.chains.question_answering')
+def dummy_load_qa_chain(llm=None, chain_type=None):
+    class Chain:
+        def run(self, *a, **k):
+            return ''
+    return Chain()
+lc_qa_mod.load_qa_chain = dummy_load_qa_chain
+sys.modules.setdefault('langchain.chains.question_answering', lc_qa_mod)
@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+import blob_store
+
+
+def test_container_client_created_once(monkeypatch):
+    created = []
+
+    class DummyService:
+        @classmethod
+        def from_connection_string(cls, conn_str, **kwargs):
+            created.append((conn_str, kwargs))
+            return cls()
+
+        def get_container_client(self, name):
+            return ("container", name)
+
+    monkeypatch.setattr(blob_store, "BlobServiceClient", DummyService)
+    monkeypatch.setattr(blob_store, "_containers", {})
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(
+            blob_store.get_container_client("conn", "resources", pool_size=4)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [("container", "resources")] * 8
+    assert len(created) == 1
+    assert created[0][1]["max_chunk_get_size"] == blob_store.BLOB_CHUNK_SIZE
+
+
+class FakeBlobClient:
+    def __init__(self, store, name, requests):
+        self.store = store
+        self.name = name
+        self.requests = requests
+
+    def download_blob(self, etag=None, match_condition=None):
+        self.requests.append((self.name, etag))
+        content, current = self.store[self.name]
+        if etag is not None and etag == current:
+            # What azure-storage-blob raises for a 304 on a conditional GET
+            error = blob_store.HttpResponseError(message="Not Modified")
+            error.status_code = 304
+            raise error
+
+        class Downloader:
+            properties = type("props", (), {"etag": current})()
+
+            def chunks(self):
+                yield content[:3]
+                yield content[3:]
+        return Downloader()
+
+
+class FakeContainer:
+    def __init__(self, store):
+        self.store = store
+        self.requests = []
+
+    def get_blob_client(self, name):
+        return FakeBlobClient(self.store, name, self.requests)
+
+
+def test_blob_cache_revalidates_with_etag(tmp_path):
+    store = {"cv.docx": (b"cv-v1-bytes", '"e1"')}
+    container = FakeContainer(store)
+    cache = blob_store.BlobCache(str(tmp_path), max_bytes=1024)
+
+    assert b"".join(cache.open(container, "cv.docx")) == b"cv-v1-bytes"
+    assert b"".join(cache.open(container, "cv.docx")) == b"cv-v1-bytes"
+    assert container.requests == [("cv.docx", None), ("cv.docx", '"e1"')]
+    assert cache.stats()["hits"] == 1
+
+    store["cv.docx"] = (b"cv-v2-bytes", '"e2"')
+    assert b"".join(cache.open(container, "cv.docx")) == b"cv-v2-bytes"
+    assert b"".join(cache.open(container, "cv.docx")) == b"cv-v2-bytes"
+    assert cache.stats()["hits"] == 2
+
+
+def test_blob_cache_reraises_other_http_errors(tmp_path):
+    store = {"cv.docx": (b"cv-v1-bytes", '"e1"')}
+    container = FakeContainer(store)
+    cache = blob_store.BlobCache(str(tmp_path), max_bytes=1024)
+    assert b"".join(cache.open(container, "cv.docx")) == b"cv-v1-bytes"
+
+    def forbidden(etag=None, match_condition=None):
+        error = blob_store.HttpResponseError(message="Forbidden")
+        error.status_code = 403
+        raise error
+
+    container.get_blob_client = lambda name: type(
+        "client", (), {"download_blob": staticmethod(forbidden)})()
+    with pytest.raises(blob_store.HttpResponseError):
+        cache.open(container, "cv.docx")
+
+
+def test_disk_lru_evicts_oldest(tmp_path):
+    import os
+
+    lru = blob_store.DiskLRU(str(tmp_path), max_bytes=10)
+    for i, key in enumerate(["a", "b", "c"]):
+        f, tmp = lru.writer()
+        with f:
+            f.write(b"12345")
+        os.utime(tmp, (i, i))
+        lru.commit(tmp, key)
+    assert lru.open("a") is None
+    assert lru.open("c") is not None
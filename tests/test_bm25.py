@@ -0,0 +1,40 @@
+from bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def corpus():
+    return BM25Index.build(
+        ["harvard.pdf", "cv.docx", "interview.pptx"],
+        ["Harvard referencing guide: citing books and journals",
+         "How to write a CV and cover letter",
+         "Interview questions, interview tips and a CV checklist"])
+
+
+def test_tokenize_drops_case_punctuation_and_stopwords():
+    assert tokenize("How to write a CV?") == ["write", "cv"]
+
+
+def test_scores_rank_rarer_and_repeated_terms_higher():
+    index = corpus()
+    hits = index.search("harvard referencing")
+    assert [index.keys[i] for i, _ in hits] == ["harvard.pdf"]
+
+    hits = index.search("interview cv")
+    assert [index.keys[i] for i, _ in hits] == ["interview.pptx", "cv.docx"]
+    assert index.search("astrophysics") == []
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index.build(["a", "b"], ["alpha beta", "beta"],
+                            payloads=[{"title": "A"}, {"title": "B"}])
+    index.save(tmp_path / "lexical.npz")
+    loaded = BM25Index.load(tmp_path / "lexical.npz")
+
+    assert loaded.keys == ["a", "b"]
+    assert loaded.payloads == [{"title": "A"}, {"title": "B"}]
+    assert loaded.scores("alpha beta").tolist() == index.scores("alpha beta").tolist()
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c", "a"], ["c", "d"]])
+    assert fused == ["c", "a", "b", "d"]
+    assert reciprocal_rank_fusion([[], []]) == []
@@ -10,24 +10,24 @@ spec.loader.exec_module(main)
 class DummyContainer:
     def get_blob_client(self, name):
         class BlobClient:
+            def get_blob_properties(self):
+                return type("props", (), {"etag": '"etag-' + name + '"'})()
             def download_blob(self):
                 class Blob:
                     def readall(self):
                         return b"content-" + name.encode()
+                    def chunks(self):
+                        yield b"content-"
+                        yield name.encode()
                 return Blob()
         return BlobClient()
 
-class DummyService:
-    @classmethod
-    def from_connection_string(cls, *a, **k):
-        return cls()
-    def get_container_client(self, *a, **k):
-        return DummyContainer()
 
 
 def test_zip_includes_pathways(monkeypatch):
-    monkeypatch.setattr(main, "BlobServiceClient", DummyService)
+    monkeypatch.setattr(main, "blob_container", DummyContainer)
     monkeypatch.setattr(main, "MAX_DOWNLOAD_WORKERS", 1)
+    monkeypatch.setattr(main, "ZIP_STREAMING", False)
 
     data = {
         "files": ["doc1.txt"],
@@ -56,3 +56,76 @@ def test_zip_includes_pathways(monkeypatch):
     assert "Title: T" in text
     assert "Description: D" in text
     assert "URL: U" in text
+
+
+def test_zip_streams_entries_in_order(monkeypatch):
+    monkeypatch.setattr(main, "blob_container", DummyContainer)
+    monkeypatch.setattr(main, "MAX_DOWNLOAD_WORKERS", 2)
+    monkeypatch.setattr(main, "ZIP_STREAMING", True)
+
+    data = {"files": ["a.pdf", "b.docx", "c.txt"], "pathways": []}
+
+    class DummyReq:
+        @staticmethod
+        def get_json():
+            return data
+    monkeypatch.setattr(main, "request", DummyReq)
+
+    captured = {}
+    def fake_response(body, mimetype=None, headers=None):
+        captured["parts"] = list(body)
+        captured["mimetype"] = mimetype
+        captured["headers"] = headers
+        return "streamed"
+    monkeypatch.setattr(main, "Response", fake_response)
+
+    assert main.download_zip() == "streamed"
+    assert captured["mimetype"] == "application/zip"
+    assert len(captured["parts"]) > 1
+    z = zipfile.ZipFile(io.BytesIO(b"".join(captured["parts"])))
+    assert z.namelist() == ["a.pdf", "b.docx", "c.txt"]
+    assert z.read("b.docx") == b"content-b.docx"
+
+
+def test_streamed_entries_may_exceed_zip64_limit(monkeypatch):
+    # Stand-in for a blob over 2 GiB: lower the limit instead
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 8)
+
+    parts = list(main.stream_zip(DummyContainer(), ["large.pdf"], []))
+
+    z = zipfile.ZipFile(io.BytesIO(b"".join(parts)))
+    assert z.read("large.pdf") == b"content-large.pdf"
+
+
+def test_repeated_selection_served_from_bundle_cache(monkeypatch, tmp_path):
+    downloads = []
+
+    class CountingContainer(DummyContainer):
+        def get_blob_client(self, name):
+            downloads.append(name)
+            return super().get_blob_client(name)
+
+    monkeypatch.setattr(main, "blob_container", CountingContainer)
+    monkeypatch.setattr(main, "ZIP_STREAMING", False)
+    monkeypatch.setattr(main, "BUNDLE_CACHE",
+                        main.BundleCache(str(tmp_path), max_bytes=1 << 20))
+
+    class DummyReq:
+        @staticmethod
+        def get_json():
+            return {"files": ["b.pdf", "a.pdf"], "pathways": []}
+    monkeypatch.setattr(main, "request", DummyReq)
+
+    sent = []
+    def fake_send_file(f, **kwargs):
+        sent.append(f.read() if hasattr(f, "read") else f.getvalue())
+        return "sent"
+    monkeypatch.setattr(main, "send_file", fake_send_file)
+
+    assert main.download_zip() == "sent"
+    downloads.clear()
+    assert main.download_zip() == "sent"
+
+    assert sent[0] == sent[1]
+    assert sorted(downloads) == ["a.pdf", "b.pdf"]  # ETag checks only
+    assert main.BUNDLE_CACHE.stats()["hits"] == 1
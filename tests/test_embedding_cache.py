@@ -0,0 +1,47 @@
+from embedding_cache import CachedEmbeddings, EmbeddingStore
+
+
+class CountingEmbeddings:
+    model = "fake-model"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def test_only_new_chunks_are_embedded(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "emb.sqlite"))
+    inner = CountingEmbeddings()
+    cached = CachedEmbeddings(inner, store)
+
+    assert cached.embed_documents(["aa", "bbb"]) == [[2.0, 1.0], [3.0, 1.0]]
+    assert cached.embed_documents(["aa", "cccc", "cccc"]) == [
+        [2.0, 1.0], [4.0, 1.0], [4.0, 1.0]
+    ]
+    assert inner.calls == [["aa", "bbb"], ["cccc"]]
+    assert cached.stats() == {
+        "cached": 2, "embedded": 3, "api_calls": 2, "hit_rate": 0.4
+    }
+
+    # A fresh process reuses the vectors persisted on disk
+    again = CachedEmbeddings(CountingEmbeddings(), EmbeddingStore(store.path))
+    again.embed_documents(["bbb"])
+    assert again.stats()["api_calls"] == 0
+
+
+def test_vectors_are_per_model(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "emb.sqlite"))
+    CachedEmbeddings(CountingEmbeddings(), store).embed_documents(["x"])
+    other = CachedEmbeddings(CountingEmbeddings(), store, model="other")
+    other.embed_documents(["x"])
+    assert other.stats()["embedded"] == 1
+
+
+def test_compact_drops_unused_vectors(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "emb.sqlite"))
+    store.put_many("m", [("h1", [1.0]), ("h2", [2.0])])
+    assert store.compact(older_than_days=-1) == 2
+    assert store.count() == 0
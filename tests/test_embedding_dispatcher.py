@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from embedding_dispatcher import EmbeddingDispatcher
+
+
+class SlowEmbeddings:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        time.sleep(self.delay)
+        return [[float(len(t))] for t in texts]
+
+
+def embed_all(dispatcher, texts):
+    results = {}
+
+    def worker(text):
+        results[text] = dispatcher.embed(text, timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_queries_share_batches():
+    inner = SlowEmbeddings()
+    dispatcher = EmbeddingDispatcher(inner.embed_documents, window=0.02,
+                                     max_batch=64, max_in_flight=1)
+    texts = ["q" * n for n in range(1, 21)]
+
+    results = embed_all(dispatcher, texts)
+
+    assert results == {t: [float(len(t))] for t in texts}
+    assert sorted(t for call in inner.calls for t in call) == sorted(texts)
+    assert len(inner.calls) < len(texts)
+    stats = dispatcher.stats()
+    assert stats["requests"] == 20
+    assert stats["batches"] == len(inner.calls)
+    assert stats["mean_batch_size"] == 20 / len(inner.calls)
+
+
+def test_identical_queries_are_embedded_once():
+    inner = SlowEmbeddings()
+    dispatcher = EmbeddingDispatcher(inner.embed_documents, window=0.02,
+                                     max_in_flight=1)
+    first = dispatcher.submit("same")
+    results = embed_all(dispatcher, ["same", "same", "same"])
+
+    assert first.result(5) == results["same"] == [4.0]
+    assert sum(call.count("same") for call in inner.calls) == 1
+    assert dispatcher.stats()["deduplicated"] >= 1
+
+
+def test_idle_query_is_sent_without_waiting():
+    inner = SlowEmbeddings(delay=0)
+    dispatcher = EmbeddingDispatcher(inner.embed_documents, window=5)
+
+    start = time.monotonic()
+    assert dispatcher.embed("hello", timeout=5) == [5.0]
+    assert time.monotonic() - start < 1
+    assert inner.calls == [["hello"]]
+
+
+def test_errors_reach_every_waiting_caller():
+    def failing(texts):
+        raise RuntimeError("rate limited")
+
+    dispatcher = EmbeddingDispatcher(failing)
+    with pytest.raises(RuntimeError, match="rate limited"):
+        dispatcher.embed("boom", timeout=5)
+    # A failed text is not left pending, so it can be retried
+    with pytest.raises(RuntimeError):
+        dispatcher.embed("boom", timeout=5)
+    assert dispatcher.stats()["batches"] == 2
@@ -0,0 +1,130 @@
+import json
+
+import numpy as np
+
+from index_store import (ANN_INDEX_FILE, IndexStore, build_ann_index,
+                         index_exists, write_ann_index, write_index)
+
+
+class Doc:
+    def __init__(self, page_content, metadata):
+        self.page_content = page_content
+        self.metadata = metadata
+
+
+def docs_and_vectors():
+    docs = [Doc(f"chunk {i} – ünïcode", {"source": f"f{i % 2}.pdf",
+                                         "summary": f"S{i % 2}",
+                                         "tags": ["general"] if i % 2 else []})
+            for i in range(6)]
+    vectors = np.random.default_rng(0).normal(size=(6, 8)).astype("float32")
+    return docs, vectors
+
+
+def test_round_trip_normalises_document_metadata(tmp_path):
+    docs, vectors = docs_and_vectors()
+    path = str(tmp_path / "index")
+    write_index(path, docs, vectors)
+
+    assert index_exists(path)
+    store = IndexStore.load(path)
+    assert len(store) == 6
+    assert isinstance(store.vectors, np.memmap)
+    assert len(json.load(open(tmp_path / "index" / "documents.json"))) == 2
+    chunk = store.chunk(3)
+    assert chunk.page_content == "chunk 3 – ünïcode"
+    assert chunk.metadata == {"source": "f1.pdf", "summary": "S1", "tags": ["general"]}
+
+
+def test_search_matches_brute_force_l2(tmp_path):
+    docs, vectors = docs_and_vectors()
+    write_index(str(tmp_path / "index"), docs, vectors)
+    store = IndexStore.load(str(tmp_path / "index"))
+
+    query = vectors[4] + 0.01
+    expected = np.argsort(((vectors - query) ** 2).sum(axis=1))[:3]
+    results = store.similarity_search_with_score_by_vector(query.tolist(), k=3)
+
+    assert [d.page_content for d, _ in results] == [docs[i].page_content for i in expected]
+    assert [s for _, s in results] == sorted(s for _, s in results)
+    assert abs(results[0][1] - ((vectors[4] - query) ** 2).sum()) < 1e-4
+
+
+def test_float16_store_and_incremental_selection(tmp_path):
+    docs, vectors = docs_and_vectors()
+    write_index(str(tmp_path / "index"), docs, vectors, dtype="float16")
+    store = IndexStore.load(str(tmp_path / "index"))
+    assert store.vectors.dtype == np.float16
+
+    kept, kept_vectors = store.without_sources({"f0.pdf"})
+    assert [d.metadata["source"] for d in kept] == ["f1.pdf"] * 3
+    assert kept_vectors.shape == (3, 8)
+    top = store.similarity_search_by_vector(vectors[1].tolist(), k=1)[0]
+    assert top.page_content == docs[1].page_content
+
+
+def test_rebuild_switches_versions_without_a_missing_index(tmp_path):
+    import os
+    import shutil
+
+    docs, vectors = docs_and_vectors()
+    path = str(tmp_path / "index")
+    # A plain directory written by an older build is replaced by the symlink
+    write_index(str(tmp_path / "plain"), docs[:2], vectors[:2])
+    shutil.copytree(os.path.realpath(tmp_path / "plain"), path)
+    shutil.rmtree(os.path.realpath(tmp_path / "plain"))
+    os.remove(tmp_path / "plain")
+
+    write_index(path, docs[:4], vectors[:4])
+    assert os.path.islink(path) and len(IndexStore.load(path)) == 4
+    old = IndexStore.load(path)
+    write_index(path, docs, vectors)
+    previous = os.path.realpath(path)
+    write_index(path, docs, vectors)
+
+    assert len(IndexStore.load(path)) == 6
+    # Only the current version and the one before it are kept
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        ["index", os.path.basename(previous),
+         os.path.basename(os.path.realpath(path))])
+    assert not os.path.exists(old.path)
+    assert old.chunk(1).page_content == docs[1].page_content
+
+
+def test_ann_index_shortlists_and_rescores_exactly(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(400, 16)).astype("float32")
+    docs = [Doc(f"chunk {i}", {"source": f"f{i}.pdf"}) for i in range(400)]
+    ann = build_ann_index(vectors, "IVF8,Flat")
+    path = str(tmp_path / "index")
+    write_index(path, docs, vectors,
+                extra_files={ANN_INDEX_FILE: lambda p: write_ann_index(ann, p)})
+
+    store = IndexStore.load(path, search_params="nprobe=8")
+    assert store.ann is not None and store.ann.ntotal == 400
+    query = vectors[7] + 0.01
+    rows, scores = store.search(query, k=5)
+    exact = np.argsort(((vectors - query) ** 2).sum(axis=1))[:5]
+    # Every list probed: the shortlist holds the exact neighbours
+    assert rows.tolist() == exact.tolist()
+    assert np.allclose(scores, ((vectors[rows] - query) ** 2).sum(axis=1),
+                       atol=1e-4)
+
+
+def test_ann_without_rerank_never_reads_vectors(tmp_path):
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(400, 16)).astype("float32")
+    docs = [Doc(f"chunk {i}", {"source": f"f{i}.pdf"}) for i in range(400)]
+    ann = build_ann_index(vectors, "IVF8,SQ8")
+    path = str(tmp_path / "index")
+    write_index(path, docs, vectors,
+                extra_files={ANN_INDEX_FILE: lambda p: write_ann_index(ann, p)})
+
+    store = IndexStore.load(path, search_params="nprobe=8", rerank=0)
+    store.vectors = store.norms = None
+    query = vectors[7] + 0.01
+    rows, scores = store.search(query, k=5)
+    assert rows[0] == 7 and len(rows) == 5
+    assert np.all(np.diff(scores) >= 0)
+    assert np.allclose(scores, ((vectors[rows] - query) ** 2).sum(axis=1),
+                       rtol=0.1, atol=0.1)
@@ -24,6 +24,8 @@ def import_main():
     flask.jsonify = lambda *a, **kw: None
     flask.send_from_directory = lambda *a, **kw: None
     flask.send_file = lambda *a, **kw: None
+    flask.Response = lambda *a, **kw: None
+    flask.stream_with_context = lambda gen: gen
     modules['flask'] = flask
 
     # dotenv stub
@@ -57,9 +59,9 @@ def import_main():
     modules['langchain_community.vectorstores'] = faiss
     modules['langchain_community.embeddings'] = emb
 
-    chains = types.ModuleType('langchain.chains')
-    chains.RetrievalQA = object
-    modules['langchain.chains'] = chains
+    qa = types.ModuleType('langchain.chains.question_answering')
+    qa.load_qa_chain = lambda *a, **kw: None
+    modules['langchain.chains.question_answering'] = qa
 
     lco = types.ModuleType('langchain_openai')
     lco.ChatOpenAI = object
@@ -99,17 +101,23 @@ class DummyIndex:
             self.docstore._dict[f'g{i}'] = DummyDoc(name, f'sum-{name}', ['general'])
             i += 1
 
-    def similarity_search_with_score(self, query, k=15):
+    def similarity_search_with_score_by_vector(self, embedding, k=15):
         return self._query_docs[:k]
 
 
+def install(main, version, index):
+    snapshot = main.IndexSnapshot(version, index)
+    main.INDEXES.install(snapshot)
+    return snapshot
+
+
 def test_general_docs_added_when_missing():
     main = import_main()
     main.AZURE_BLOB_BASE_URL = "http://blob/"
-    main.VECTOR_INDEX = DummyIndex(
+    install(main, 'general', DummyIndex(
         query_docs=[('doc1.pdf', 0.1, []), ('doc2.pdf', 0.2, [])],
         general_docs=['gen1.pdf', 'gen2.pdf']
-    )
+    ))
     res = main.get_links_with_summaries('q', top_k=2)
     names = [r['name'] for r in res]
     assert names[:2] == ['doc1.pdf', 'doc2.pdf']
@@ -119,10 +127,10 @@ def test_general_docs_added_when_missing():
 def test_sorted_by_score():
     main = import_main()
     main.AZURE_BLOB_BASE_URL = "http://blob/"
-    main.VECTOR_INDEX = DummyIndex(
+    install(main, 'sorted', DummyIndex(
         query_docs=[('docB.pdf', 0.2, []), ('docA.pdf', 0.1, []), ('docC.pdf', 0.15, [])],
         general_docs=['gen.pdf']
-    )
+    ))
     res = main.get_links_with_summaries('q', top_k=3)
     names = [r['name'] for r in res]
     assert names[:3] == ['docA.pdf', 'docC.pdf', 'docB.pdf']
@@ -132,12 +140,47 @@ def test_sorted_by_score():
 def test_keyword_boost_reranks():
     main = import_main()
     main.AZURE_BLOB_BASE_URL = "http://blob/"
-    main.VECTOR_INDEX = DummyIndex(
+    install(main, 'boost', DummyIndex(
         query_docs=[('catguide.pdf', 0.2, []), ('other.pdf', 0.1, [])],
         general_docs=[]
-    )
+    ))
     res = main.get_links_with_summaries('cat', top_k=2)
     names = [r['name'] for r in res]
     assert names[0] == 'catguide.pdf'
 
 
+def test_catalogue_built_once_per_index():
+    main = import_main()
+    main.AZURE_BLOB_BASE_URL = "http://blob/"
+    index = DummyIndex(
+        query_docs=[('doc1.pdf', 0.1, [])],
+        general_docs=['gen.pdf']
+    )
+    first = install(main, 'catalogue-1', index).catalogue
+    assert set(first.entries) == {'doc1.pdf', 'gen.pdf'}
+    assert [e['name'] for e in first.general] == ['gen.pdf']
+    # Ranking joins against the snapshot's catalogue, not the docstore
+    index.docstore._dict.clear()
+    names = [r['name'] for r in main.get_links_with_summaries('x', top_k=1)]
+    assert names == ['doc1.pdf', 'gen.pdf']
+
+    other = install(main, 'catalogue-2',
+                    DummyIndex(query_docs=[], general_docs=['other.pdf']))
+    assert set(other.catalogue.entries) == {'other.pdf'}
+
+
+def test_links_from_compact_index_store(tmp_path):
+    from index_store import IndexStore, write_index
+
+    main = import_main()
+    main.AZURE_BLOB_BASE_URL = "http://blob/"
+    docs = [DummyDoc('near.pdf', 'sum-near'), DummyDoc('far.pdf', 'sum-far'),
+            DummyDoc('gen.pdf', 'sum-gen', ['general'])]
+    for doc in docs:
+        doc.page_content = doc.metadata['source']
+    write_index(str(tmp_path / 'index'), docs, [[0.0], [5.0], [9.0]])
+    snapshot = install(main, 'compact', IndexStore.load(str(tmp_path / 'index')))
+
+    assert [e['name'] for e in snapshot.catalogue.general] == ['gen.pdf']
+    res = main.get_links_with_summaries('q', top_k=2)
+    assert [r['name'] for r in res] == ['near.pdf', 'far.pdf', 'gen.pdf']
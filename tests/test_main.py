@@ -12,6 +12,12 @@ class DummyDoc:
         self.metadata = metadata
 
 
+def use_indexes(monkeypatch, documents=None, pathways=None, version='test'):
+    snapshot = main.IndexSnapshot(version, documents, pathways)
+    monkeypatch.setattr(main.INDEXES, 'current', snapshot)
+    return snapshot
+
+
 def test_get_links_with_summaries_includes_general(monkeypatch):
     query_doc = DummyDoc({'source': 'doc1.pdf', 'summary': 'doc1 sum', 'tags': []})
     general_doc = DummyDoc({'source': 'general.txt', 'summary': 'gen sum', 'tags': ['general']})
@@ -20,12 +26,358 @@ def test_get_links_with_summaries_includes_general(monkeypatch):
         def __init__(self):
             self.docstore = type('ds', (), {'_dict': {'q': query_doc, 'g': general_doc}})()
 
-        def similarity_search_with_score(self, query, k=15):
+        def similarity_search_with_score_by_vector(self, embedding, k=15):
             return [(query_doc, 0.1)]
 
-    monkeypatch.setattr(main, 'VECTOR_INDEX', DummyIndex())
     monkeypatch.setattr(main, 'AZURE_BLOB_BASE_URL', 'https://files/')
+    use_indexes(monkeypatch, DummyIndex())
 
     links = main.get_links_with_summaries('query')
     assert {'name': 'doc1.pdf', 'url': 'https://files/doc1.pdf', 'summary': 'doc1 sum'} in links
     assert {'name': 'general.txt', 'url': 'https://files/general.txt', 'summary': 'gen sum'} in links
+
+
+def test_ask_embeds_query_once(monkeypatch):
+    calls = []
+
+    class CountingEmbeddings:
+        def embed_documents(self, texts):
+            calls.extend(texts)
+            return [[0.1, 0.2] for _ in texts]
+
+    class DummyIndex:
+        docstore = type('ds', (), {'_dict': {}})()
+
+        def similarity_search_by_vector(self, embedding, k=4):
+            assert embedding == [0.1, 0.2]
+            return []
+
+        def similarity_search_with_score_by_vector(self, embedding, k=15):
+            assert embedding == [0.1, 0.2]
+            return []
+
+    class DummyChain:
+        def run(self, input_documents=None, question=None):
+            return f'answer to {question}'
+
+    class DummyReq:
+        @staticmethod
+        def get_json():
+            return {'message': 'CV help'}
+
+    monkeypatch.setattr(main, 'EMBEDDINGS', CountingEmbeddings())
+    pathways = main.PathwayMatcher(
+        [{'title': 'CV Clinic', 'description': '', 'url': 'u/cv', 'keywords': ['cv']}],
+        [[0.2, 0.1]])
+    use_indexes(monkeypatch, DummyIndex(), pathways)
+    monkeypatch.setattr(main, 'QA_CHAIN', DummyChain())
+    monkeypatch.setattr(main, 'request', DummyReq)
+    monkeypatch.setattr(main, 'jsonify', lambda payload: payload)
+
+    resp = main.ask_gpt()
+    assert resp['reply'] == 'answer to cv help'
+    assert [p['url'] for p in resp['pathways']] == ['u/cv']
+    assert calls == ['cv help']
+
+
+def test_slow_stage_falls_back(monkeypatch):
+    import time
+
+    def slow_pathways(query):
+        time.sleep(0.5)
+        return [{'title': 'late'}]
+
+    stages = {
+        'reply': lambda q: 'answer',
+        'downloads': lambda q: [{'name': 'doc.pdf'}],
+        'pathways': slow_pathways,
+    }
+    monkeypatch.setattr(main, 'ASK_PARALLEL', True)
+    monkeypatch.setitem(main.STAGE_TIMEOUTS, 'pathways', 0.05)
+
+    results = main.run_stages(stages, main.QueryContext('q'))
+    assert results == {
+        'reply': 'answer',
+        'downloads': [{'name': 'doc.pdf'}],
+        'pathways': [],
+    }
+
+
+def test_failed_stage_keeps_finished_results(monkeypatch):
+    def failing_reply(query):
+        raise RuntimeError('embedding failed')
+
+    stages = {
+        'reply': failing_reply,
+        'downloads': lambda q: [{'name': 'doc.pdf'}],
+        'pathways': lambda q: [{'title': 'CV pathway'}],
+    }
+    for parallel in (True, False):
+        monkeypatch.setattr(main, 'ASK_PARALLEL', parallel)
+        results = main.run_stages(stages, main.QueryContext('q'))
+        assert results == {
+            'reply': main.STAGE_FALLBACKS['reply'],
+            'downloads': [{'name': 'doc.pdf'}],
+            'pathways': [{'title': 'CV pathway'}],
+        }
+
+
+def test_stuck_replies_do_not_starve_search_stages(monkeypatch):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    release = threading.Event()
+    monkeypatch.setattr(main, 'ASK_PARALLEL', True)
+    monkeypatch.setattr(main, 'REPLY_EXECUTOR', ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(main, 'STAGE_EXECUTOR', ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setitem(main.STAGE_TIMEOUTS, 'reply', 0.05)
+    monkeypatch.setitem(main.STAGE_TIMEOUTS, 'downloads', 1)
+    stages = {
+        'reply': lambda q: release.wait(5) and 'late answer',
+        'downloads': lambda q: [{'name': 'doc.pdf'}],
+    }
+    try:
+        for _ in range(3):
+            results = main.run_stages(stages, main.QueryContext('q'))
+            assert results == {'reply': main.STAGE_FALLBACKS['reply'],
+                               'downloads': [{'name': 'doc.pdf'}]}
+    finally:
+        release.set()
+
+
+def test_links_served_from_query_cache(monkeypatch):
+    calls = []
+    doc = DummyDoc({'source': 'cv.docx', 'summary': 'cv sum', 'tags': []})
+
+    class DummyIndex:
+        docstore = type('ds', (), {'_dict': {'d': doc}})()
+
+        def similarity_search_with_score_by_vector(self, embedding, k=15):
+            calls.append(embedding)
+            return [(doc, 0.1)]
+
+    use_indexes(monkeypatch, DummyIndex())
+    monkeypatch.setattr(main, 'QUERY_CACHE', main.QueryCache())
+
+    first = main.get_links_with_summaries('Interview  skills')
+    second = main.get_links_with_summaries('interview skills')
+    assert first == second
+    assert len(calls) == 1
+    assert main.QUERY_CACHE.stats()['hits'] >= 1
+
+
+def test_ask_stream_sends_links_before_tokens(monkeypatch):
+    import json
+
+    doc = DummyDoc({'source': 'cv.docx', 'summary': 'cv sum', 'tags': []})
+    doc.page_content = 'chunk text'
+
+    class DummyIndex:
+        docstore = type('ds', (), {'_dict': {'d': doc}})()
+
+        def similarity_search_by_vector(self, embedding, k=4):
+            return [doc]
+
+        def similarity_search_with_score_by_vector(self, embedding, k=15):
+            return [(doc, 0.1)]
+
+    class DummyPrompt:
+        def format_messages(self, context=None, question=None):
+            return [f'{context}|{question}']
+
+    class DummyChain:
+        document_separator = '\n\n'
+        document_variable_name = 'context'
+        llm_chain = type('lc', (), {'prompt': DummyPrompt()})()
+
+    class DummyLLM:
+        def stream(self, messages):
+            assert messages == ['chunk text|stream me']
+            for part in ['Hello', ' there']:
+                yield type('chunk', (), {'content': part})()
+
+    class DummyReq:
+        @staticmethod
+        def get_json():
+            return {'message': 'Stream me'}
+
+    use_indexes(monkeypatch, DummyIndex())
+    monkeypatch.setattr(main, 'QA_CHAIN', DummyChain())
+    monkeypatch.setattr(main, 'QA_LLM', DummyLLM())
+    monkeypatch.setattr(main, 'ANSWER_CACHE', main.SemanticCache())
+    monkeypatch.setattr(main, 'request', DummyReq)
+    monkeypatch.setattr(main, 'Response', lambda body, **kw: list(body))
+
+    frames = main.ask_stream()
+    events = [(f.split('\n')[0][len('event: '):],
+               json.loads(f.split('\n')[1][len('data: '):])) for f in frames]
+    assert [e for e, _ in events] == [
+        'downloads', 'pathways', 'token', 'token', 'done'
+    ]
+    assert events[0][1][0]['name'] == 'cv.docx'
+    assert ''.join(p for e, p in events if e == 'token') == 'Hello there'
+
+
+def test_request_keeps_its_snapshot_across_reload(monkeypatch, tmp_path):
+    old = use_indexes(monkeypatch, version='v1')
+    ctx = main.QueryContext('q')
+
+    def loader(version, previous):
+        assert previous is old
+        return main.IndexSnapshot(version)
+
+    manager = main.IndexManager(loader, [str(tmp_path)])
+    manager.install(old)
+    monkeypatch.setattr(main, 'INDEXES', manager)
+    (tmp_path / 'index.bin').write_bytes(b'new')
+
+    assert manager.reload()
+    assert not manager.reload()
+    assert ctx.indexes is old and ctx.cache_key('links').startswith('links|v1|')
+    assert main.QueryContext('q').indexes.version == manager.fingerprint() != 'v1'
+
+
+def test_reload_never_swaps_compact_index_for_legacy_pickle(monkeypatch, tmp_path):
+    import os
+    from index_store import write_index
+
+    class Chunk:
+        page_content = 'cv chunk'
+        metadata = {'source': 'cv.docx'}
+
+    path = str(tmp_path / 'document_index')
+    write_index(path, [Chunk()], [[1.0]])
+    monkeypatch.setattr(main, 'DOCUMENT_STORE_DIR', path)
+    monkeypatch.setattr(main, 'load_pathway_index', lambda: None)
+    previous = main.load_indexes('v1')
+    assert isinstance(previous.documents, main.IndexStore)
+
+    # A reload landing while the index is missing keeps the loaded one
+    os.remove(path)
+    snapshot = main.load_indexes('v2', previous)
+    assert snapshot.documents is previous.documents
+
+
+def test_admin_reload_requires_token(monkeypatch):
+    class DummyReq:
+        headers = {'Authorization': 'Bearer wrong'}
+        args = {'force': '1'}
+
+    reloads = []
+    monkeypatch.setattr(main, 'request', DummyReq)
+    monkeypatch.setattr(main, 'jsonify', lambda payload: payload)
+    monkeypatch.setattr(main.INDEXES, 'reload', lambda force: reloads.append(force) or True)
+
+    monkeypatch.setattr(main, 'ADMIN_TOKEN', None)
+    assert main.admin_reload()[1] == 403
+    monkeypatch.setattr(main, 'ADMIN_TOKEN', 'secret')
+    assert main.admin_reload()[1] == 403
+
+    DummyReq.headers = {'Authorization': 'Bearer secret'}
+    assert main.admin_reload()['reloaded'] is True
+    assert reloads == [True]
+
+
+def test_keyword_query_ranked_lexically_without_embedding(monkeypatch):
+    from bm25 import BM25Index
+
+    harvard = DummyDoc({'source': 'harvard.pdf', 'summary': 'Harvard referencing', 'tags': []})
+    cv = DummyDoc({'source': 'cv.docx', 'summary': 'Writing a CV', 'tags': []})
+    general = DummyDoc({'source': 'guide.pdf', 'summary': 'Start here', 'tags': ['general']})
+    searches = []
+
+    class DummyIndex:
+        docstore = type('ds', (), {'_dict': {'h': harvard, 'c': cv, 'g': general}})()
+
+        def similarity_search_with_score_by_vector(self, embedding, k=15):
+            searches.append(embedding)
+            return [(cv, 0.1), (harvard, 0.2)]
+
+    class NoEmbeddings:
+        def embed_documents(self, texts):
+            searches.extend(texts)
+            return [[0.0] for _ in texts]
+
+    lexical = BM25Index.build(['harvard.pdf', 'cv.docx', 'guide.pdf'],
+                              ['harvard referencing citations',
+                               'cv writing cover letter', 'start here'])
+    snapshot = use_indexes(monkeypatch, DummyIndex())
+    snapshot.lexical = lexical
+    monkeypatch.setattr(main, 'EMBEDDINGS', NoEmbeddings())
+    monkeypatch.setattr(main, 'QUERY_CACHE', main.QueryCache())
+
+    links = main.get_links_with_summaries('Harvard referencing')
+    assert [l['name'] for l in links] == ['harvard.pdf', 'guide.pdf']
+    assert searches == []
+
+    # Longer queries fuse both rankings: harvard.pdf is found by both
+    links = main.get_links_with_summaries('harvard referencing for my essay please')
+    assert [l['name'] for l in links] == ['harvard.pdf', 'cv.docx', 'guide.pdf']
+    assert len(searches) == 2
+
+
+def test_answer_and_links_share_one_search(monkeypatch):
+    cv = DummyDoc({'source': 'cv.docx', 'summary': 'cv sum', 'tags': []})
+    cv.page_content = 'cv chunk'
+    letter = DummyDoc({'source': 'letter.pdf', 'summary': 'letter sum', 'tags': []})
+    letter.page_content = 'letter chunk'
+    searches = []
+
+    class DummyIndex:
+        docstore = type('ds', (), {'_dict': {}})()
+
+        def similarity_search_with_score_by_vector(self, embedding, k=4):
+            searches.append(k)
+            return [(cv, 0.1), (cv, 0.2), (letter, 0.3), (cv, 0.4), (letter, 0.5)]
+
+    class DummyChain:
+        def run(self, input_documents=None, question=None):
+            return ' '.join(d.page_content for d in input_documents)
+
+    use_indexes(monkeypatch, DummyIndex(), version='shared-search')
+    monkeypatch.setattr(main, 'QA_CHAIN', DummyChain())
+    monkeypatch.setattr(main, 'ANSWER_CACHE', main.SemanticCache())
+
+    results = main.run_stages({'reply': main.answer_question,
+                               'downloads': main.get_links_with_summaries},
+                              main.QueryContext('cover letters'))
+    assert results['reply'] == 'cv chunk cv chunk letter chunk cv chunk'
+    assert [l['name'] for l in results['downloads']] == ['cv.docx', 'letter.pdf']
+    assert searches == [main.RETRIEVAL_K]
+
+
+def test_short_keyword_query_links_follow_answer_chunks(monkeypatch):
+    from bm25 import BM25Index
+
+    harvard = DummyDoc({'source': 'harvard.pdf', 'summary': 'Harvard guide', 'tags': []})
+    essay = DummyDoc({'source': 'essay.docx', 'summary': 'Essay writing', 'tags': []})
+    essay.page_content = 'harvard referencing in essays'
+
+    class DummyIndex:
+        docstore = type('ds', (), {'_dict': {'h': harvard, 'e': essay}})()
+
+        def similarity_search_with_score_by_vector(self, embedding, k=4):
+            return [(essay, 0.1)]
+
+    class DummyChain:
+        def run(self, input_documents=None, question=None):
+            return ' '.join(d.metadata['source'] for d in input_documents)
+
+    class DummyReq:
+        @staticmethod
+        def get_json():
+            return {'message': 'Harvard referencing'}
+
+    # BM25 alone would only offer harvard.pdf
+    lexical = BM25Index.build(['harvard.pdf', 'essay.docx'],
+                              ['harvard referencing citations', 'essays'])
+    snapshot = use_indexes(monkeypatch, DummyIndex(), version='short-keyword')
+    snapshot.lexical = lexical
+    monkeypatch.setattr(main, 'QA_CHAIN', DummyChain())
+    monkeypatch.setattr(main, 'ANSWER_CACHE', main.SemanticCache())
+    monkeypatch.setattr(main, 'request', DummyReq)
+    monkeypatch.setattr(main, 'jsonify', lambda payload: payload)
+
+    resp = main.ask_gpt()
+    assert resp['reply'] == 'essay.docx'
+    assert 'essay.docx' in [l['name'] for l in resp['downloads']]
@@ -0,0 +1,41 @@
+import numpy as np
+
+from pathway_matcher import PathwayMatcher
+
+ENTRIES = [
+    {"title": "LinkedIn Masterclass", "description": "Optimise profiles.",
+     "keywords": ["linkedin", "networking", "profile"], "url": "u/linkedin"},
+    {"title": "Academic Writing & Referencing", "description": "Citations.",
+     "keywords": ["writing", "referencing", "harvard"], "url": "u/writing"},
+    {"title": "Creative CV Design", "description": "Stand-out CVs.",
+     "keywords": ["cv", "design", "creative"], "url": "u/cv"},
+]
+VECTORS = [[1.0, 0.0, 0.0], [0.0, 2.0, 0.0], [0.0, 0.6, 0.8]]
+
+
+def test_keyword_query_needs_no_embedding():
+    matcher = PathwayMatcher(ENTRIES, VECTORS)
+    results = matcher.match("Harvard referencing")
+    assert [r["url"] for r in results] == ["u/writing"]
+    assert set(results[0]) == {"title", "description", "url"}
+    # Not every term is a keyword: the caller has to embed the query
+    assert matcher.match("help me with harvard please") is None
+
+
+def test_cosine_scores_with_keyword_boost():
+    matcher = PathwayMatcher(ENTRIES, VECTORS, keyword_weight=0.5)
+    assert np.allclose(np.linalg.norm(matcher.matrix, axis=1), 1)
+
+    query = [0.0, 0.9, 0.45]
+    results = matcher.match("improving my writing", query, k=2)
+    assert [r["url"] for r in results] == ["u/writing", "u/cv"]
+
+    results = matcher.match("a creative portfolio", query, k=2)
+    assert [r["url"] for r in results] == ["u/cv", "u/writing"]
+
+
+def test_save_load_round_trip(tmp_path):
+    PathwayMatcher(ENTRIES, VECTORS).save(tmp_path / "pathways.npz")
+    loaded = PathwayMatcher.load(tmp_path / "pathways.npz")
+    assert loaded.entries == ENTRIES
+    assert loaded.match("cv")[0]["url"] == "u/cv"
@@ -0,0 +1,72 @@
+import time
+
+from query_cache import (QueryCache, SQLiteCacheBackend, SemanticCache,
+                         literal_terms, normalise_query)
+
+
+def test_normalise_query():
+    assert normalise_query("  Interview   Skills ") == "interview skills"
+
+
+def test_lru_eviction_and_counters():
+    cache = QueryCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["hits"] == 2 and stats["misses"] == 1
+
+
+def test_ttl_expiry():
+    cache = QueryCache(max_entries=4, ttl=0.01)
+    cache.set("cv", [0.1])
+    time.sleep(0.02)
+    assert cache.get("cv") is None
+
+
+def test_sqlite_backend_shared_between_caches(tmp_path):
+    path = str(tmp_path / "cache.db")
+    writer = QueryCache(backend=SQLiteCacheBackend(path))
+    reader = QueryCache(backend=SQLiteCacheBackend(path))
+    writer.set("links|v1|cv", [{"name": "cv.docx"}])
+    assert reader.get("links|v1|cv") == [{"name": "cv.docx"}]
+    assert reader.stats()["hits"] == 1
+
+
+def test_semantic_cache_matches_similar_queries():
+    cache = SemanticCache(threshold=0.9, max_entries=2)
+    cache.add([1.0, 0.0], "cv answer", "v1")
+    assert cache.lookup([0.99, 0.05], "v1") == "cv answer"
+    assert cache.lookup([0.0, 1.0], "v1") is None
+
+
+def test_semantic_cache_evicts_lru_and_invalidates_on_version():
+    cache = SemanticCache(threshold=0.9, max_entries=2)
+    cache.add([1.0, 0.0], "a", "v1")
+    cache.add([0.0, 1.0], "b", "v1")
+    assert cache.lookup([1.0, 0.0], "v1") == "a"
+    cache.add([0.7, 0.7], "c", "v1")  # replaces "b", the least recently used
+    assert cache.lookup([0.0, 1.0], "v1") is None
+    assert cache.lookup([1.0, 0.0], "v2") is None
+
+
+def test_semantic_cache_ttl():
+    cache = SemanticCache(threshold=0.9, ttl=0.01)
+    cache.add([1.0, 0.0], "a", "v1")
+    time.sleep(0.02)
+    assert cache.lookup([1.0, 0.0], "v1") is None
+
+
+def test_semantic_cache_requires_matching_numbers():
+    cache = SemanticCache()
+    cache.add([1.0, 0.0], "level 4 answer", "v1", literal_terms("level 4 law"))
+    # Near-identical embeddings, but a different level or module code
+    assert cache.lookup([0.999, 0.01], "v1", literal_terms("level 5 law")) is None
+    assert cache.lookup([0.999, 0.01], "v1", literal_terms("level 4 law com1001")) is None
+    assert cache.lookup([0.999, 0.01], "v1",
+                        literal_terms("Law at Level 4?")) == "level 4 answer"
+    assert literal_terms("COM1001 level 4 in 2024") == {"com1001", "4", "2024"}
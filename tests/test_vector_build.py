@@ -1,3 +1,10 @@
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 import importlib.util
 from pathlib import Path
@@ -7,6 +14,8 @@ spec = importlib.util.spec_from_file_location(
 )
 vb = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(vb)
+# Extraction runs in worker processes, which look functions up by module name
+sys.modules.setdefault("vector_build", vb)
 
 
 def test_read_file_txt():
@@ -26,3 +35,367 @@ def test_is_general_purpose_true():
 
 def test_is_general_purpose_false():
     assert not vb.is_general_purpose("Specific content", [], "file.pdf")
+
+
+class FakeBlob:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeContainer:
+    def __init__(self, files):
+        self.files = files
+
+    def list_blobs(self):
+        return [FakeBlob(name) for name in self.files]
+
+    def get_blob_client(self, name):
+        content = self.files[name]
+
+        class Client:
+            def download_blob(self):
+                class Downloader:
+                    def readinto(self, stream):
+                        stream.write(content)
+                return Downloader()
+        return Client()
+
+
+class FakeEmbeddings:
+    model = "fake"
+
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+
+class FakeFAISS:
+    """Pickle-era LangChain FAISS store, as loaded from ``faiss_index``."""
+
+    def __init__(self, docs, vectors):
+        ids = [f"id{i}" for i in range(len(docs))]
+        self.index_to_docstore_id = dict(enumerate(ids))
+        self.docstore = type("ds", (), {
+            "search": lambda _, doc_id: dict(zip(ids, docs))[doc_id]})()
+        self.index = type("ix", (), {
+            "ntotal": len(docs),
+            "reconstruct_n": lambda _, start, n: vb.np.asarray(vectors[start:start + n],
+                                                               dtype="float32")})()
+
+    @classmethod
+    def load_local(cls, path, embeddings, **kwargs):
+        return cls([vb.Document(page_content="old", metadata={"source": "a.txt"})],
+                   [[3.0]])
+
+
+def stored(path=None):
+    store = vb.IndexStore.load(path or vb.INDEX_DIR)
+    return [store.chunk(i) for i in range(len(store))]
+
+
+def stored_sources():
+    return sorted(doc.metadata["source"] for doc in stored())
+
+
+def test_incremental_build_upserts_changed_and_drops_removed(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    container = FakeContainer({"a.txt": b"alpha", "b.txt": b"beta"})
+    monkeypatch.setattr(vb, "get_container_client", lambda *a, **k: container)
+    monkeypatch.setattr(vb, "OpenAIEmbeddings", FakeEmbeddings)
+    monkeypatch.setattr(vb, "existing_hashes", {})
+
+    vb.main()
+    assert stored_sources() == ["a.txt", "b.txt"]
+
+    container.files = {"a.txt": b"alpha v2", "c.txt": b"gamma"}
+    monkeypatch.setattr(vb, "existing_hashes", json.load(open(vb.HASH_RECORD_FILE)))
+    vb.main()
+
+    assert stored_sources() == ["a.txt", "c.txt"]
+    assert {d.page_content for d in stored()} == {"alpha v2", "gamma"}
+    store = vb.IndexStore.load(vb.INDEX_DIR)
+    assert sorted(store.vectors.tolist()) == [[5.0], [8.0]]
+    assert set(json.load(open(vb.HASH_RECORD_FILE))) == {"a.txt", "c.txt"}
+    assert not os.path.exists(vb.INDEX_DIR + ".tmp")
+
+    lexical = vb.BM25Index.load(os.path.join(vb.INDEX_DIR, vb.LEXICAL_INDEX_FILE))
+    assert sorted(lexical.keys) == ["a.txt", "c.txt"]
+    assert [lexical.keys[i] for i, _ in lexical.search("gamma")] == ["c.txt"]
+
+
+def test_ann_index_written_when_configured(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    docs = [vb.Document(page_content=f"chunk {i}", metadata={"source": "a.txt"})
+            for i in range(3)]
+    vectors = [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]
+
+    monkeypatch.setattr(vb, "INDEX_ANN", "HNSW8")
+    vb.save_index(docs, vectors)
+    store = vb.IndexStore.load(vb.INDEX_DIR)
+    assert store.ann.ntotal == 3
+    assert store.rerank == vb.ANN_RERANK
+    assert store.search([0.9, 0.1], k=1)[0].tolist() == [0]
+
+    # The rerank setting is recorded with the index for main.py to use
+    monkeypatch.setattr(vb, "ANN_RERANK", 0)
+    vb.save_index(docs, vectors)
+    assert vb.IndexStore.load(vb.INDEX_DIR).rerank == 0
+
+    # Too few vectors to train 64 lists: the build falls back to exact search
+    monkeypatch.setattr(vb, "INDEX_ANN", "IVF64,Flat")
+    vb.save_index(docs, vectors)
+    assert not os.path.exists(os.path.join(vb.INDEX_DIR, vb.ANN_INDEX_FILE))
+    assert vb.IndexStore.load(vb.INDEX_DIR).ann is None
+
+
+def collect_pipeline(blobs, container, timeout=10):
+    """Run ``run_pipeline`` to completion on a thread, failing on a stall."""
+    results = []
+    worker = threading.Thread(target=lambda: results.extend(
+        vb.run_pipeline(blobs, container, {})), daemon=True)
+    worker.start()
+    worker.join(timeout)
+    assert not worker.is_alive(), "pipeline stalled"
+    return results
+
+
+def test_pipeline_skips_failed_and_unsupported_files(monkeypatch):
+    container = FakeContainer({"a.txt": b"alpha", "bad.txt": b"boom",
+                               "skip.xyz": b"?"})
+    real_extract = vb.extract_chunks
+
+    def extract(content, filename):
+        if filename == "bad.txt":
+            raise ValueError("corrupt file")
+        return real_extract(content, filename)
+
+    monkeypatch.setattr(vb, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(vb, "extract_chunks", extract)
+    monkeypatch.setattr(vb, "generate_summary_and_tags",
+                        lambda *a, **k: ("summary", []))
+    monkeypatch.setattr(vb, "PIPELINE_QUEUE_SIZE", 1)
+
+    # "gone.txt" is listed but its download fails
+    blobs = [FakeBlob(n) for n in ["bad.txt", "skip.xyz", "gone.txt", "a.txt"]]
+    results = collect_pipeline(blobs, container)
+
+    assert [(name, [d.page_content for d in docs])
+            for name, _, docs in results] == [("a.txt", ["alpha"])]
+
+
+def test_pipeline_stalls_downloads_behind_a_slow_stage(monkeypatch):
+    files = {f"f{i}.txt": f"file {i}".encode() for i in range(10)}
+    container = FakeContainer(files)
+    fetched, extracted = [], []
+    release = threading.Event()
+    real_fetch, real_extract = vb.fetch_blob, vb.extract_chunks
+
+    def fetch(blob, *args):
+        fetched.append(blob.name)
+        return real_fetch(blob, *args)
+
+    def extract(content, filename):
+        extracted.append(filename)
+        return real_extract(content, filename)
+
+    def summary(*args, **kwargs):
+        release.wait(10)
+        return "summary", []
+
+    monkeypatch.setattr(vb, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(vb, "fetch_blob", fetch)
+    monkeypatch.setattr(vb, "extract_chunks", extract)
+    monkeypatch.setattr(vb, "generate_summary_and_tags", summary)
+    monkeypatch.setattr(vb, "PIPELINE_QUEUE_SIZE", 1)
+    monkeypatch.setattr(vb, "MAX_WORKERS", 1)
+    monkeypatch.setattr(vb, "SUMMARY_CONCURRENCY", 1)
+
+    blobs = [FakeBlob(name) for name in files]
+    results = []
+    worker = threading.Thread(target=lambda: results.extend(
+        vb.run_pipeline(blobs, container, {})), daemon=True)
+    worker.start()
+    time.sleep(0.3)
+    # One file is in the summary stage; nothing else may be parsed, and
+    # only the queue slots plus blocked producers hold downloaded files
+    assert len(extracted) == 1
+    assert len(fetched) <= 4
+    release.set()
+    worker.join(10)
+    assert not worker.is_alive()
+    assert sorted(name for name, _, _ in results) == sorted(files)
+
+
+def test_legacy_faiss_index_converted_without_reembedding(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(vb.LEGACY_INDEX_FILE)
+    container = FakeContainer({"a.txt": b"alpha", "b.txt": b"beta"})
+    monkeypatch.setattr(vb, "get_container_client", lambda *a, **k: container)
+    monkeypatch.setattr(vb, "FAISS", FakeFAISS)
+    monkeypatch.setattr(vb, "OpenAIEmbeddings", FakeEmbeddings)
+    monkeypatch.setattr(vb, "existing_hashes", {"a.txt": vb.calculate_file_hash(b"alpha")})
+
+    vb.main()
+
+    assert {(d.metadata["source"], d.page_content) for d in stored()} == {
+        ("a.txt", "old"), ("b.txt", "beta")}
+
+
+def test_unchanged_blob_skipped_without_download():
+    import datetime
+
+    class ListedBlob:
+        name = "cv.docx"
+        etag = '"0x2"'
+        size = 10
+        last_modified = datetime.datetime(2025, 1, 1)
+        content_settings = type("cs", (), {
+            "content_md5": bytearray(bytes.fromhex("ab" * 16))
+        })()
+
+    class NoDownloads:
+        def get_blob_client(self, name):
+            raise AssertionError("blob should not be downloaded")
+
+    # Legacy MD5-only entry: recognised through Content-MD5
+    name, record, content = vb.fetch_blob(ListedBlob(), NoDownloads(),
+                                          {"cv.docx": "ab" * 16})
+    assert content is None
+    assert record["etag"] == '"0x2"' and record["md5"] == "ab" * 16
+
+    # Current manifest entry: recognised through the ETag alone
+    ListedBlob.content_settings = None
+    _, _, content = vb.fetch_blob(ListedBlob(), NoDownloads(), {"cv.docx": record})
+    assert content is None
+
+
+def test_changed_properties_fall_back_to_md5():
+    record = {"md5": vb.calculate_file_hash(b"same"), "etag": '"old"'}
+    blob = FakeBlob("a.txt")
+    blob.etag = '"new"'
+    container = FakeContainer({"a.txt": b"same"})
+    name, new_record, content = vb.fetch_blob(blob, container, {"a.txt": record})
+    assert content is None
+    assert new_record["etag"] == '"new"'
+
+
+def test_pdf_read_with_pymupdf():
+    if vb.pymupdf is None:
+        pytest.skip("PyMuPDF not installed")
+    doc = vb.pymupdf.open()
+    for text in ["first page", "second page"]:
+        doc.new_page().insert_text((72, 72), text)
+    data = doc.tobytes()
+
+    backend, pages = vb.extract_text(data, "guide.pdf")
+    assert backend == "pymupdf"
+    assert [p.strip() for p in pages] == ["first page", "second page"]
+
+
+def test_extractor_falls_back_per_file(monkeypatch):
+    def broken(file_bytes):
+        raise RuntimeError("cannot open")
+
+    monkeypatch.setitem(vb.EXTRACTORS, ".txt", [("broken", broken)])
+    vb.register_extractor(".txt", "text", lambda b: iter([b.decode()]))
+    backend, segments = vb.extract_text(b"hello", "notes.txt")
+    assert backend == "text"
+    assert list(segments) == ["hello"]
+
+
+def test_split_segments_carries_text_across_windows():
+    class WordSplitter:
+        def split_text(self, text):
+            return text.split()
+
+    pages = ["alpha beta", "gamma delta", "epsilon"]
+    chunks = list(vb.split_segments(iter(pages), WordSplitter(), window=8))
+    assert chunks == ["alpha", "beta", "gamma", "delta", "epsilon"]
+
+
+def test_embedding_stage_batches_by_tokens():
+    client = FakeEmbeddings()
+    stage = vb.EmbeddingStage(client, max_tokens=10, max_batch=100,
+                              concurrency=2)
+    docs = [vb.Document(page_content="x" * 16, metadata={"i": i})
+            for i in range(5)]
+    stage.add(docs[:3])
+    stage.add(docs[3:])
+    out_docs, vectors = stage.results()
+
+    # Each chunk is ~5 tokens, so two fit in a 10-token request
+    assert [len(b) for b in client.batches] == [2, 2, 1]
+    assert [d.metadata["i"] for d in out_docs] == [0, 1, 2, 3, 4]
+    assert vectors == [[16.0]] * 5
+
+
+def test_embedding_stage_backs_off_on_rate_limit(monkeypatch):
+    class RateLimited(Exception):
+        status_code = 429
+
+    class Flaky(FakeEmbeddings):
+        calls = 0
+
+        def embed_documents(self, texts):
+            Flaky.calls += 1
+            if Flaky.calls == 1:
+                raise RateLimited("slow down")
+            return super().embed_documents(texts)
+
+    sleeps = []
+    monkeypatch.setattr(vb.time, "sleep", sleeps.append)
+    stage = vb.EmbeddingStage(Flaky(), concurrency=4)
+    stage.add([vb.Document(page_content="hello", metadata={})])
+    _, vectors = stage.results()
+
+    assert vectors == [[5.0]]
+    assert stage.rate_limited == 1 and len(sleeps) == 1
+    # Halved on the 429, then one slot back after the successful retry
+    assert stage.limit.limit == 3
+
+
+def test_embedding_stage_gives_up_on_other_errors():
+    class Broken(FakeEmbeddings):
+        def embed_documents(self, texts):
+            raise RuntimeError("bad request")
+
+    stage = vb.EmbeddingStage(Broken())
+    stage.add([vb.Document(page_content="hello", metadata={})])
+    with pytest.raises(RuntimeError):
+        stage.results()
+
+
+def test_parse_summary_json_and_text_fallback():
+    assert vb.parse_summary('{"summary": "About AI.", "tags": ["#AI", "Ethics"]}') == (
+        "About AI.", ["ai", "ethics"])
+    summary, tags = vb.parse_summary("About AI.\nTags: #ai, ethics")
+    assert summary == "About AI." and sorted(tags) == ["ai", "ethics"]
+
+
+def test_summaries_reused_by_file_hash_on_full_rebuild(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    container = FakeContainer({"a.txt": b"alpha", "b.txt": b"beta"})
+    prompts = []
+
+    class FakeLLM:
+        def invoke(self, prompt):
+            prompts.append(prompt)
+            return type("Res", (), {"content": '{"summary": "S", "tags": ["t"]}'})()
+
+    monkeypatch.setattr(vb, "get_container_client", lambda *a, **k: container)
+    monkeypatch.setattr(vb, "OpenAIEmbeddings", FakeEmbeddings)
+    monkeypatch.setattr(vb, "summary_llm", lambda: FakeLLM())
+    monkeypatch.setattr(vb, "existing_hashes", {})
+
+    vb.main()
+    assert len(prompts) == 2
+
+    container.files = {"a.txt": b"alpha", "b.txt": b"beta v2"}
+    vb.main(full_rebuild=True)
+    assert len(prompts) == 3 and "beta v2" in prompts[-1]
+
+    assert {d.metadata["summary"] for d in stored()} == {"S"}
+    assert len(json.load(open(vb.SUMMARY_CACHE_FILE))) == 2
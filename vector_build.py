@@ -3,8 +3,13 @@ import re
 import io
 import hashlib
 import json
-from azure.storage.blob import BlobServiceClient
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+import queue
+import random
+import argparse
+import functools
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from docx import Document as DocxDocument
 from pptx import Presentation
 from PyPDF2 import PdfReader
@@ -13,16 +18,66 @@ from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 from dotenv import load_dotenv
+import numpy as np
+
+try:
+    import pymupdf
+except ImportError:  # PyMuPDF < 1.24.3 only ships the ``fitz`` name
+    try:
+        import fitz as pymupdf
+    except ImportError:
+        pymupdf = None
+
+from blob_store import get_container_client
+from bm25 import BM25Index, tokenize
+from embedding_cache import CachedEmbeddings, EmbeddingStore
+from index_store import (ANN_INDEX_FILE, ANN_RERANK, IndexStore,
+                         build_ann_index, faiss_rows, index_exists,
+                         write_ann_index, write_index)
 
 load_dotenv()
 
 AZURE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 AZURE_CONTAINER_NAME = "resources"
-INDEX_FILE = "faiss_index"
+# Compact, memory-mapped index read by main.py (see index_store.py)
+INDEX_DIR = os.getenv("DOCUMENT_INDEX_DIR", "document_index")
+# Vector precision on disk: float32, or float16 for half the size
+INDEX_DTYPE = os.getenv("INDEX_DTYPE", "float32")
+# Optional approximate search: a FAISS index_factory string such as
+# "HNSW32", "IVF256,Flat", "IVF256,SQ8" or "IVF256,PQ32" (unset = exact)
+INDEX_ANN = os.getenv("INDEX_ANN", "")
+# ANN candidates main.py re-scores exactly per result, recorded with the
+# index; 0 serves the ANN distances so the vectors need not stay in memory
+ANN_RERANK = int(os.getenv("ANN_RERANK", str(ANN_RERANK)))
+# BM25 index over file names, summaries, tags and chunk text, kept with it
+LEXICAL_INDEX_FILE = "lexical.npz"
+# Pickle-based FAISS index written by older builds; converted on first run
+LEGACY_INDEX_FILE = "faiss_index"
 HASH_RECORD_FILE = "hashes.json"
 MAX_WORKERS = int(os.getenv("CONCURRENT_WORKERS", "3"))
-
-# Load existing hash records if present
+# Parsing is CPU-bound, so it gets its own process pool sized to the cores
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Downloaded files allowed to wait for (or be in) extraction at once
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE",
+                                    str(2 * EXTRACT_WORKERS)))
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".pptx", ".txt")
+# Chunk embeddings already paid for, keyed by model + chunk text hash
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_DB", "embedding_cache.sqlite")
+# Embedding requests are sized by (estimated) tokens and input count, and a
+# few run concurrently; the concurrency is halved on every 429.
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "50000"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "1000"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "8"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-3.5-turbo")
+# Summary requests allowed in flight at once
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_CACHE_FILE = os.getenv("SUMMARY_CACHE_FILE", "summaries.json")
+
+# Load the blob manifest if present.  Each entry records the MD5 of the blob
+# content plus the ETag, last-modified time and size seen in list_blobs, so
+# unchanged blobs are recognised without downloading them.  Older manifests
+# stored only the MD5 hex string per blob.
 if os.path.exists(HASH_RECORD_FILE):
     with open(HASH_RECORD_FILE, "r") as f:
         existing_hashes = json.load(f)
@@ -34,6 +89,39 @@ def calculate_file_hash(content):
     return hashlib.md5(content).hexdigest()
 
 
+def blob_properties(blob):
+    """Change-detection fields that ``list_blobs`` already reports for ``blob``."""
+    settings = getattr(blob, "content_settings", None)
+    content_md5 = getattr(settings, "content_md5", None)
+    last_modified = getattr(blob, "last_modified", None)
+    return {
+        "etag": getattr(blob, "etag", None),
+        "md5": bytes(content_md5).hex() if content_md5 else None,
+        "last_modified": last_modified.isoformat() if last_modified else None,
+        "size": getattr(blob, "size", None),
+    }
+
+
+def manifest_record(entry):
+    """Normalise a manifest entry, accepting the older MD5-only format."""
+    if isinstance(entry, str):
+        return {"md5": entry}
+    return dict(entry or {})
+
+
+def unchanged_since(record, props):
+    """Whether blob properties prove the blob still matches ``record``."""
+    if not record:
+        return False
+    if props["etag"] and props["etag"] == record.get("etag"):
+        return True
+    if props["md5"]:
+        return props["md5"] == record.get("md5")
+    return (not props["etag"] and props["last_modified"] is not None
+            and props["last_modified"] == record.get("last_modified")
+            and props["size"] == record.get("size"))
+
+
 def get_blob_content(blob_client):
     stream = io.BytesIO()
     blob_client.download_blob().readinto(stream)
@@ -41,26 +129,95 @@ def get_blob_content(blob_client):
     return stream.read()
 
 
-def read_file(file_bytes, filename):
-    if filename.endswith(".pdf"):
-        reader = PdfReader(io.BytesIO(file_bytes))
-        return "\n".join([page.extract_text() or "" for page in reader.pages])
-    elif filename.endswith(".docx"):
-        doc = DocxDocument(io.BytesIO(file_bytes))
-        return "\n".join([para.text for para in doc.paragraphs])
-    elif filename.endswith(".pptx"):
-        prs = Presentation(io.BytesIO(file_bytes))
-        text = []
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text.append(shape.text)
-        return "\n".join(text)
-    elif filename.endswith(".txt"):
-        return file_bytes.decode("utf-8", errors="ignore")
-    else:
+# ── Text extractors ──
+# Each backend takes the raw file bytes and returns an iterator of text
+# segments (pages, paragraphs or slide shapes).  Opening the file happens
+# when the backend is called, so a backend that cannot read a file raises
+# straight away and the next one registered for that extension is tried.
+
+def _pymupdf_pages(file_bytes):
+    if pymupdf is None:
+        raise RuntimeError("PyMuPDF is not installed")
+    doc = pymupdf.open(stream=file_bytes, filetype="pdf")
+
+    def pages():
+        with doc:
+            for page in doc:
+                yield page.get_text()
+    return pages()
+
+
+def _pypdf2_pages(file_bytes):
+    reader = PdfReader(io.BytesIO(file_bytes))
+    return (page.extract_text() or "" for page in reader.pages)
+
+
+def _docx_paragraphs(file_bytes):
+    doc = DocxDocument(io.BytesIO(file_bytes))
+    return (para.text for para in doc.paragraphs)
+
+
+def _pptx_shapes(file_bytes):
+    prs = Presentation(io.BytesIO(file_bytes))
+    return (shape.text for slide in prs.slides for shape in slide.shapes
+            if hasattr(shape, "text"))
+
+
+def _plain_text(file_bytes):
+    return iter([file_bytes.decode("utf-8", errors="ignore")])
+
+
+EXTRACTORS = {
+    ".pdf": [("pymupdf", _pymupdf_pages), ("pypdf2", _pypdf2_pages)],
+    ".docx": [("python-docx", _docx_paragraphs)],
+    ".pptx": [("python-pptx", _pptx_shapes)],
+    ".txt": [("text", _plain_text)],
+}
+
+
+def register_extractor(extension, name, extractor, first=False):
+    """Add a backend for ``extension``; ``first`` makes it the preferred one."""
+    backends = EXTRACTORS.setdefault(extension, [])
+    backends.insert(0 if first else len(backends), (name, extractor))
+
+
+def extract_text(file_bytes, filename):
+    """Return ``(backend_name, segments)`` from the first backend that opens the file."""
+    extension = os.path.splitext(filename)[1].lower()
+    backends = EXTRACTORS.get(extension)
+    if not backends:
         raise ValueError("Unsupported file type")
 
+    errors = []
+    for name, extractor in backends:
+        try:
+            return name, extractor(file_bytes)
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+    raise ValueError(f"No extractor could read {filename} ({'; '.join(errors)})")
+
+
+def read_file(file_bytes, filename):
+    return "\n".join(extract_text(file_bytes, filename)[1])
+
+
+def split_segments(segments, splitter, window=20000):
+    """Split text arriving segment by segment without joining the whole file.
+
+    Text is buffered until it reaches ``window`` characters, split, and every
+    chunk except the last is emitted; the last one is carried over so chunks
+    still flow across page boundaries.
+    """
+    buffer = ""
+    for segment in segments:
+        buffer = f"{buffer}\n{segment}" if buffer else segment
+        if len(buffer) >= window:
+            chunks = splitter.split_text(buffer)
+            yield from chunks[:-1]
+            buffer = chunks[-1] if chunks else ""
+    if buffer:
+        yield from splitter.split_text(buffer)
+
 
 def is_general_purpose(summary, tags, filename):
     name_lower = filename.lower()
@@ -69,106 +226,515 @@ def is_general_purpose(summary, tags, filename):
             or "general" in tags or "main" in tags)
 
 
-def generate_summary_and_tags(text, filename):
-    llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo")  # 🔁 Updated model
-    prompt = (
-        f"Summarise the following document in 2–3 sentences. Then suggest up to 3 topical tags. "
-        f"Document name: {filename}\n\n"
-        f"Content:\n{text[:3000]}")
-    response = llm.invoke(prompt).content.strip()
+SUMMARY_PROMPT = (
+    "Summarise the following document in 2–3 sentences and suggest up to 3 "
+    "topical tags. Reply with a JSON object of the form "
+    '{{"summary": "...", "tags": ["...", "..."]}}.\n'
+    "Document name: {filename}\n\n"
+    "Content:\n{text}")
+
+
+@functools.lru_cache(maxsize=None)
+def summary_llm():
+    """Chat client shared by every summary request in this process."""
+    return ChatOpenAI(temperature=0,
+                      model=SUMMARY_MODEL,
+                      model_kwargs={"response_format": {"type": "json_object"}})
+
+
+def parse_summary(response):
+    """Return ``(summary, tags)`` from the model's JSON reply.
+
+    Falls back to the old "summary, then Tags: ..." text format when the
+    reply is not valid JSON.
+    """
+    try:
+        data = json.loads(response)
+        summary = str(data.get("summary", "")).strip()
+        tags = [str(tag).lstrip("#").lower() for tag in data.get("tags", [])]
+        return summary, tags
+    except (ValueError, AttributeError, TypeError):
+        pass
 
     summary_match = re.match(r"^(.*?)(?:Tags?:|\n|$)", response, re.DOTALL)
     tags_match = re.findall(
         r"#?(\b\w+\b)",
         response.split("Tags:")[-1]) if "Tags:" in response else []
-
     summary = summary_match.group(1).strip() if summary_match else ""
-    tags = list(set(tag.lower() for tag in tags_match))
+    return summary, [tag.lower() for tag in tags_match]
+
+
+class SummaryCache:
+    """LLM summaries and tags keyed by the MD5 of the file they describe.
+
+    Kept in ``summaries.json`` so an unchanged file is never summarised
+    again, including on a ``--full`` rebuild.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = {}
+
+    def get(self, file_hash):
+        with self._lock:
+            entry = self._entries.get(file_hash) if file_hash else None
+        return (entry["summary"], entry["tags"]) if entry else None
+
+    def set(self, file_hash, summary, tags):
+        if file_hash:
+            with self._lock:
+                self._entries[file_hash] = {"summary": summary, "tags": tags}
+
+    def save(self, keep=None):
+        """Write the cache, dropping hashes not in ``keep`` when given."""
+        with self._lock:
+            if keep is not None:
+                self._entries = {h: e for h, e in self._entries.items()
+                                 if h in keep}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+
+
+def generate_summary_and_tags(text, filename, cache=None, file_hash=None):
+    cached = cache.get(file_hash) if cache is not None else None
+    if cached is not None:
+        summary, tags = cached
+    else:
+        prompt = SUMMARY_PROMPT.format(filename=filename, text=text[:3000])
+        response = summary_llm().invoke(prompt).content.strip()
+        summary, tags = parse_summary(response)
+        if cache is not None:
+            cache.set(file_hash, summary, tags)
 
+    tags = list(set(tags))
     if is_general_purpose(summary, tags, filename):
         tags.append("general")
 
     return summary, list(set(tags))
 
 
-def process_blob(blob, container_client):
+def fetch_blob(blob, container_client, known_hashes=None):
+    """Download stage: return ``(filename, record, content)`` for ``blob``.
+
+    ``content`` is ``None`` when the blob is unchanged since the manifest
+    ``record`` was written; unsupported files return ``None``.
+    """
     filename = blob.name
-    if not filename.endswith((".pdf", ".docx", ".pptx", ".txt")):
+    if not filename.endswith(SUPPORTED_EXTENSIONS):
         return None
+    if known_hashes is None:
+        known_hashes = existing_hashes
 
+    record = manifest_record(known_hashes.get(filename))
+    props = blob_properties(blob)
+    if unchanged_since(record, props):
+        print(f"✅ Skipped (no changes): {filename}")
+        record.update((k, v) for k, v in props.items() if v is not None)
+        return filename, record, None
+
+    # Properties missing or different: fall back to hashing the content
     blob_client = container_client.get_blob_client(filename)
     content = get_blob_content(blob_client)
     file_hash = calculate_file_hash(content)
+    new_record = dict(props, md5=file_hash)
 
-    if existing_hashes.get(filename) == file_hash:
+    if record.get("md5") == file_hash:
         print(f"✅ Skipped (no changes): {filename}")
-        return None
-
-    try:
-        text = read_file(content, filename)
-        summary, tags = generate_summary_and_tags(text, filename)
-
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=100)
-        chunks = splitter.split_text(text)
-
-        docs = [
-            Document(page_content=chunk,
-                     metadata={
-                         "source": filename,
-                         "summary": summary,
-                         "tags": tags,
-                     })
-            for chunk in chunks
-        ]
-
-        print(f"✅ Processed: {filename}")
-        return filename, file_hash, docs
-    except Exception as e:
-        print(f"❌ Failed to process {filename}: {e}")
-        return None
-
+        return filename, new_record, None
+
+    return filename, new_record, content
+
+
+def extract_chunks(content, filename):
+    """CPU stage: parse ``content`` and split it into chunks.
+
+    Runs in a worker process.  Pages are streamed from the extractor straight
+    into the splitter, and only the summary excerpt, the chunk strings and
+    the name of the backend used are sent back.
+    """
+    backend, segments = extract_text(content, filename)
+    excerpt = []
+
+    def keep_excerpt(segments):
+        size = 0
+        for segment in segments:
+            if size < 3000:
+                excerpt.append(segment[:3000 - size])
+                size += len(excerpt[-1]) + 1
+            yield segment
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=500,
+        chunk_overlap=100)
+    chunks = list(split_segments(keep_excerpt(segments), splitter))
+    return "\n".join(excerpt)[:3000], chunks, backend
+
+
+def build_docs(filename, excerpt, chunks, summaries=None, file_hash=None):
+    """Summary stage: tag the chunks of ``filename`` with its LLM summary."""
+    summary, tags = generate_summary_and_tags(excerpt, filename, summaries,
+                                              file_hash)
+    return [
+        Document(page_content=chunk,
+                 metadata={
+                     "source": filename,
+                     "summary": summary,
+                     "tags": tags,
+                 })
+        for chunk in chunks
+    ]
+
+
+def run_pipeline(blobs, container_client, known_hashes, summaries=None):
+    """Yield ``(filename, record, docs)`` for each blob as soon as it is done.
+
+    Downloads run on an I/O thread pool, parsing and chunking on a process
+    pool sized to the core count, and summaries on their own thread pool of
+    ``SUMMARY_CONCURRENCY`` workers (reusing ``summaries`` where possible).
+    Every handoff is bounded by ``PIPELINE_QUEUE_SIZE``: downloaded files
+    waiting to be parsed, files being parsed or waiting for (or in) the
+    summary stage, and finished files not yet taken by the caller.  A slow
+    stage therefore stalls the ones before it instead of piling up content
+    or chunk lists in memory.  ``docs`` is ``None`` for unchanged blobs;
+    failed or unsupported blobs are skipped.
+    """
+    downloaded = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    finished = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    # Files between the download queue and ``finished``: parsing, waiting
+    # for a summary worker or being summarised
+    processing = threading.BoundedSemaphore(PIPELINE_QUEUE_SIZE)
+
+    def download(blob):
+        try:
+            downloaded.put(fetch_blob(blob, container_client, known_hashes))
+        except Exception as e:
+            print(f"❌ Failed to download {blob.name}: {e}")
+            downloaded.put(None)
+
+    def summarise(filename, record, future):
+        try:
+            excerpt, chunks, backend = future.result()
+            docs = build_docs(filename, excerpt, chunks, summaries,
+                              record.get("md5"))
+            record["extractor"] = backend
+            print(f"✅ Processed: {filename} ({backend})")
+            result = (filename, record, docs)
+        except Exception as e:
+            print(f"❌ Failed to process {filename}: {e}")
+            result = None
+        processing.release()
+        finished.put(result)
+
+    def extracted(filename, record, future):
+        summary_pool.submit(summarise, filename, record, future)
+
+    def dispatch():
+        for _ in blobs:
+            item = downloaded.get()
+            if item is None or item[2] is None:
+                finished.put(item)
+                continue
+            filename, record, content = item
+            processing.acquire()
+            try:
+                future = cpu_pool.submit(extract_chunks, content, filename)
+            except Exception as e:
+                processing.release()
+                print(f"❌ Failed to process {filename}: {e}")
+                finished.put(None)
+                continue
+            future.add_done_callback(
+                functools.partial(extracted, filename, record))
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as io_pool, \
+            ProcessPoolExecutor(max_workers=EXTRACT_WORKERS) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=SUMMARY_CONCURRENCY) as summary_pool:
+        dispatcher = threading.Thread(target=dispatch, daemon=True)
+        dispatcher.start()
+        for blob in blobs:
+            io_pool.submit(download, blob)
+        for _ in blobs:
+            result = finished.get()
+            if result:
+                yield result
+        dispatcher.join()
 
-def main():
-    blob_service_client = BlobServiceClient.from_connection_string(
-        AZURE_CONNECTION_STRING)
-    container_client = blob_service_client.get_container_client(
-        AZURE_CONTAINER_NAME)
 
-    docs_with_metadata = []
-    new_hashes = {}
+def estimate_tokens(text):
+    """Rough token count for OpenAI embedding models (~4 characters each)."""
+    return len(text) // 4 + 1
 
-    blobs = list(container_client.list_blobs())
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(process_blob, blob, container_client)
-                   for blob in blobs]
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                filename, file_hash, docs = result
-                docs_with_metadata.extend(docs)
-                new_hashes[filename] = file_hash
+def is_rate_limited(error):
+    return (getattr(error, "status_code", None) == 429
+            or type(error).__name__ == "RateLimitError")
 
-    # ✅ SAFEGUARD: Only build FAISS if we have valid documents
-    if not docs_with_metadata:
-        print(
-            "❌ No documents were successfully processed. FAISS index not built."
-        )
-        return
 
-    print("✅ All documents processed. Now building FAISS index...")
+def retry_after(error):
+    """Seconds the server asked us to wait in its ``Retry-After`` header."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
 
-    db = FAISS.from_documents(docs_with_metadata, OpenAIEmbeddings())
-    db.save_local(INDEX_FILE)
 
-    existing_hashes.update(new_hashes)
-    with open(HASH_RECORD_FILE, "w") as f:
-        json.dump(existing_hashes, f)
+class AdaptiveLimit:
+    """Concurrency limit that halves when rate limited and recovers by one
+    slot per successful request, up to ``maximum``."""
+
+    def __init__(self, maximum):
+        self.maximum = max(1, maximum)
+        self.limit = self.maximum
+        self.active = 0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def throttle(self):
+        with self._cond:
+            self.limit = max(1, self.limit // 2)
+
+    def relax(self):
+        with self._cond:
+            if self.limit < self.maximum:
+                self.limit += 1
+                self._cond.notify_all()
+
+
+class EmbeddingStage:
+    """Embed documents in token-bounded batches while the pipeline runs.
+
+    ``add`` queues a file's chunks and submits a request whenever a batch
+    reaches ``max_tokens`` or ``max_batch`` inputs, so vectors are produced
+    as files finish instead of in one burst at the end.  Requests that hit
+    a rate limit back off exponentially (or as long as ``Retry-After``
+    says) and lower the number of requests allowed in flight.
+    """
+
+    def __init__(self, embeddings, max_tokens=EMBED_BATCH_TOKENS,
+                 max_batch=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY,
+                 max_retries=EMBED_MAX_RETRIES, backoff=1.0):
+        self.embeddings = embeddings
+        self.max_tokens = max_tokens
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.limit = AdaptiveLimit(concurrency)
+        self.docs = []
+        self.rate_limited = 0
+        self._batch = []
+        self._batch_tokens = 0
+        self._futures = []
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+
+    def add(self, docs):
+        for doc in docs:
+            tokens = estimate_tokens(doc.page_content)
+            if self._batch and (self._batch_tokens + tokens > self.max_tokens
+                                or len(self._batch) >= self.max_batch):
+                self._submit()
+            self.docs.append(doc)
+            self._batch.append(doc.page_content)
+            self._batch_tokens += tokens
+
+    def _submit(self):
+        self._futures.append(self._pool.submit(self._embed, self._batch))
+        self._batch = []
+        self._batch_tokens = 0
+
+    def _embed(self, texts):
+        for attempt in range(self.max_retries + 1):
+            with self.limit:
+                try:
+                    vectors = self.embeddings.embed_documents(texts)
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == self.max_retries:
+                        raise
+                    delay = retry_after(e)
+                else:
+                    self.limit.relax()
+                    return vectors
+            self.limit.throttle()
+            self.rate_limited += 1
+            if delay is None:
+                delay = self.backoff * 2**attempt * (0.5 + random.random())
+            print(f"⚠️ Embedding rate limited; retrying in {delay:.1f}s "
+                  f"with {self.limit.limit} request(s) in flight")
+            time.sleep(delay)
+
+    def results(self):
+        """Wait for every batch and return ``(docs, vectors)`` in order."""
+        if self._batch:
+            self._submit()
+        try:
+            vectors = [v for future in self._futures for v in future.result()]
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        return self.docs, vectors
+
+
+def build_lexical_index(docs):
+    """BM25 index with one entry per source file.
+
+    The file name, summary and tags are counted twice so they outweigh a
+    passing mention in the body text.
+    """
+    files = {}
+    for doc in docs:
+        source = doc.metadata.get("source", "")
+        tokens = files.get(source)
+        if tokens is None:
+            name = os.path.splitext(os.path.basename(source))[0]
+            header = tokenize(" ".join([
+                name,
+                doc.metadata.get("summary", ""),
+                " ".join(doc.metadata.get("tags", [])),
+            ]))
+            tokens = files[source] = header * 2
+        tokens.extend(tokenize(doc.page_content))
+    return BM25Index.build(list(files), list(files.values()))
+
+
+def save_index(docs, vectors):
+    lexical = build_lexical_index(docs)
+    extra_files = {LEXICAL_INDEX_FILE: lexical.save}
+    meta = {}
+    if INDEX_ANN and len(docs):
+        try:
+            ann = build_ann_index(vectors, INDEX_ANN)
+        except Exception as e:  # e.g. fewer vectors than IVF lists to train
+            print(f"⚠️ Skipping {INDEX_ANN} index, search stays exact: {e}")
+        else:
+            extra_files[ANN_INDEX_FILE] = functools.partial(write_ann_index,
+                                                            ann)
+            meta["ann_rerank"] = ANN_RERANK
+    write_index(INDEX_DIR, docs, vectors, dtype=INDEX_DTYPE,
+                extra_files=extra_files, meta=meta)
+
+
+def load_existing_index(embeddings):
+    """Return the current index as an ``IndexStore``, or ``None``.
+
+    A pickle-based FAISS index from an older build is converted to the
+    compact format once, reusing its vectors, so the switch needs no
+    re-embedding.
+    """
+    if index_exists(INDEX_DIR):
+        return IndexStore.load(INDEX_DIR)
+    if not os.path.exists(LEGACY_INDEX_FILE):
+        return None
+    print(f"✅ Converting {LEGACY_INDEX_FILE} to the compact index format...")
+    db = FAISS.load_local(LEGACY_INDEX_FILE,
+                          embeddings,
+                          allow_dangerous_deserialization=True)
+    save_index(*faiss_rows(db))
+    return IndexStore.load(INDEX_DIR)
+
+
+def save_hashes(hashes):
+    tmp_path = f"{HASH_RECORD_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(hashes, f)
+    os.replace(tmp_path, HASH_RECORD_FILE)
+
+
+def main(full_rebuild=False):
+    container_client = get_container_client(AZURE_CONNECTION_STRING,
+                                            AZURE_CONTAINER_NAME,
+                                            pool_size=MAX_WORKERS)
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(),
+                                  EmbeddingStore(EMBEDDING_CACHE_FILE))
+
+    # Incremental mode carries unchanged chunks over from the existing index;
+    # without one (or with --full) every blob is treated as new.
+    db = None if full_rebuild else load_existing_index(embeddings)
+    known_hashes = dict(existing_hashes) if db is not None else {}
+
+    summaries = SummaryCache(SUMMARY_CACHE_FILE)
+    embedding_stage = EmbeddingStage(embeddings)
+    manifest_updates = {}
+    changed = set()
 
-    print("✅ FAISS index saved.")
+    blobs = list(container_client.list_blobs())
+    current = {blob.name for blob in blobs}
+    removed = {name for name in known_hashes if name not in current}
+
+    for filename, record, docs in run_pipeline(blobs, container_client,
+                                               known_hashes, summaries):
+        manifest_updates[filename] = record
+        if docs is not None:
+            changed.add(filename)
+            embedding_stage.add(docs)
+    docs_with_metadata, vectors = embedding_stage.results()
+
+    # Keep summaries for every file still in the container, changed or not
+    current_records = list(existing_hashes.items()) + list(
+        manifest_updates.items())
+    summaries.save(keep={
+        manifest_record(entry).get("md5")
+        for name, entry in current_records if name in current
+    })
+
+    if db is None:
+        # ✅ SAFEGUARD: Only build the index if we have valid documents
+        if not docs_with_metadata:
+            print(
+                "❌ No documents were successfully processed. Index not built."
+            )
+            return
+
+        print("✅ All documents processed. Now writing the index...")
+    else:
+        kept_docs, kept_vectors = db.without_sources(changed | removed)
+        stale = len(db) - len(kept_docs)
+        if not stale and not docs_with_metadata:
+            known_hashes.update(manifest_updates)
+            save_hashes(known_hashes)
+            print("✅ Index already up to date.")
+            return
+
+        print(f"✅ Updating index: {len(changed)} changed, "
+              f"{len(removed)} removed, {stale} stale chunks dropped...")
+        if kept_docs:
+            docs_with_metadata = kept_docs + docs_with_metadata
+            vectors = np.concatenate(
+                [kept_vectors, np.asarray(vectors, dtype=kept_vectors.dtype)
+                 .reshape(-1, kept_vectors.shape[1])])
+
+    save_index(docs_with_metadata, vectors)
+
+    for name in removed:
+        known_hashes.pop(name, None)
+    known_hashes.update(manifest_updates)
+    save_hashes(known_hashes)
+
+    stats = embeddings.stats()
+    print(f"✅ Index saved. Embeddings: {stats['cached']} cached, "
+          f"{stats['embedded']} new in {stats['api_calls']} API calls "
+          f"({embedding_stage.rate_limited} rate-limited retries).")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build the document index.")
+    parser.add_argument("--full",
+                        action="store_true",
+                        help="re-embed every blob instead of updating the "
+                        "existing index incrementally")
+    main(full_rebuild=parser.parse_args().full)